@@ -0,0 +1,116 @@
+"""
+Cache of anonymized cell values, so text that was already analyzed skips NER.
+
+Keys are sha256 digests of the analysis configuration and the original text;
+values are the anonymized text. Recent entries are kept in a bounded LRU in
+memory and, when a path is given, in a SQLite file shared across runs. The
+original text is never stored.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 100_000
+
+# SQLite limits the number of parameters in one statement
+_SQLITE_BATCH = 500
+
+
+def text_key(config_digest, text):
+    return hashlib.sha256(f"{config_digest}\0{text}".encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Bounded LRU of key -> anonymized text, optionally backed by SQLite at
+    path. The SQLite file keeps at most max_disk_entries rows (default: the
+    same as max_entries), pruned by last use.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, path=None, max_disk_entries=None):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_entries if max_disk_entries is None else max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS analysis (key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS analysis_used ON analysis (used)")
+            self._db.commit()
+
+    def get_many(self, keys):
+        """Return {key: anonymized text} for the keys that are cached."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                value = self._memory.get(key)
+                if value is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = value
+
+            missing = [key for key in keys if key not in found]
+            if self._db is not None and missing:
+                now = time.time()
+                for start in range(0, len(missing), _SQLITE_BATCH):
+                    chunk = missing[start:start + _SQLITE_BATCH]
+                    rows = self._db.execute(
+                        f"SELECT key, value FROM analysis WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for key, value in rows:
+                        found[key] = value
+                        self._remember(key, value)
+                    self._db.executemany("UPDATE analysis SET used = ? WHERE key = ?", [(now, key) for key, _ in rows])
+                self._db.commit()
+
+            self._stats["hits"] += len(found)
+            self._stats["misses"] += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """Store (key, anonymized text) pairs."""
+        items = list(items)
+        if not items:
+            return
+
+        with self._lock:
+            for key, value in items:
+                self._remember(key, value)
+
+            if self._db is not None:
+                now = time.time()
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO analysis (key, value, used) VALUES (?, ?, ?)",
+                    [(key, value, now) for key, value in items],
+                )
+                count = self._db.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+                if count > self.max_disk_entries:
+                    self._db.execute(
+                        "DELETE FROM analysis WHERE key IN (SELECT key FROM analysis ORDER BY used LIMIT ?)",
+                        (count - self.max_disk_entries,),
+                    )
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._memory)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
@@ -1,426 +1,36 @@
-import io
+import os
 import streamlit as st
-import numpy as np
-import pandas as pd
-import json
-import csv
-import re
-import hashlib
-from datetime import datetime
-from zipfile import ZipFile
-
-
-def safe_json_read(zip_obj, file_path):
-    content = zip_obj.open(file_path).read()
-    for encoding in ['utf-8', 'latin-1', 'cp1252']:
-        try:
-            if isinstance(content, bytes):
-                decoded = content.decode(encoding)
-            else:
-                decoded = content
-            return json.loads(decoded)
-        except Exception:
-            continue
-
-    # Sanitized error - don't expose file paths
-    raise ValueError("Unable to read JSON file from Slack export. File may be corrupted or in an unexpected format.")
-
-
-def detect_delimiter(file):
-    file.seek(0)
-    sample = file.read(4096)
-    file.seek(0)
-    if isinstance(sample, bytes):
-        sample = sample.decode('utf-8', errors='ignore')
-    try:
-        sniffer = csv.Sniffer()
-        return sniffer.sniff(sample).delimiter
-    except:
-        return ','
 
+from archive_writer import COMPRESSION_METHODS, DEFAULT_COMPRESSION, spooled_output_file
+from background_job import BackgroundJob
+from pipeline import combine_data as _combine_data
+from pipeline import PREVIEW_DAY_FILES, InputArchive, preview_anonymized_export, stream_anonymized_export
+from processing_report import REPORT_NAME, ProcessingReport
+from result_cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES, ResultCache, cache_key
+from table_output import DEFAULT_OUTPUT_FORMAT, available_output_formats
 
-def round_timestamp(ts_string, round_to_minutes=1):
-    try:
-        ts_float = float(ts_string)
-        dt = datetime.fromtimestamp(ts_float)
-        # Round to nearest minute (remove seconds and microseconds)
-        rounded_dt = dt.replace(second=0, microsecond=0)
-        # Return as integer timestamp (no milliseconds)
-        return str(int(rounded_dt.timestamp()))
-    except:
-        return ts_string
-
-
-def apply_k_anonymity(df, column, k=5):
-    if column not in df.columns:
-        return df
-    
-    # First, replace any missing/null/empty values with "Others"
-    df_modified = df.copy()
-    df_modified[column] = df_modified[column].fillna("Others")
-    df_modified[column] = df_modified[column].apply(lambda x: "Others" if x == "" or pd.isna(x) else x)
-    
-    # Count occurrences of each value
-    value_counts = df_modified[column].value_counts()
-    
-    # Replace values with count < k with "Others"
-    df_modified[column] = df_modified[column].apply(lambda x: "Others" if value_counts.get(x, 0) < k else x)
-    
-    # Check if "Others" itself has < k occurrences
-    others_count = (df_modified[column] == "Others").sum()
-    if others_count > 0 and others_count < k:
-        # Replace entire column with "Others"
-        df_modified[column] = "Others"
-    
-    return df_modified
+# How often the progress bar of a running job is refreshed
+PROGRESS_REFRESH_SECONDS = 1
 
 
-def combine_data(uploaded_file, zip_uploaded_file):
-    delimiter = detect_delimiter(uploaded_file)
-    df = pd.read_csv(uploaded_file, delimiter=delimiter)
+def combine_data(uploaded_file, zip_uploaded_file, report=None):
+    return _combine_data(uploaded_file, zip_uploaded_file, warn=st.warning, report=report)
 
-    with ZipFile(zip_uploaded_file, 'r') as zip_object:
-        file_list = zip_object.namelist()
 
-        users_json_path = next((f for f in file_list if f.endswith("users.json") and '__MACOSX' not in f), None)
-        if not users_json_path:
-            raise ValueError("Slack export is missing required user data. Please ensure you've exported a complete Slack workspace.")
-
-        slack_user_data = safe_json_read(zip_object, users_json_path)
-        
-        # Check if this is already anonymized data
-        if slack_user_data and isinstance(slack_user_data, list) and slack_user_data[0].get('Clarity_ID'):
-            raise ValueError("This appears to be an already anonymized Slack export. Please upload the original Slack export ZIP file.")
-
-        slack_user_data = pd.DataFrame([{
-            "slack_id": u["id"],
-            "email_address": u["profile"].get("email"),
-            "timezone": u.get("tz_label"),
-            "is_bot": u["profile"].get("bot_id") is not None or u.get("is_bot", False)
-        } for u in slack_user_data if isinstance(u, dict) and u.get("id")])
-
-    email_col = next((c for c in ["Email Address", "email", "Email", "work_email", "Email"] if c in df.columns), None)
-    
-    if not email_col:
-        raise ValueError("HRIS file must contain an email column. Accepted names: 'Email', 'Email Address', 'email', or 'work_email'")
-
-    merged = slack_user_data.merge(df, how="outer", left_on="email_address", right_on=email_col)
-
-    # Separate bots and real users
-    employee_data = merged[merged.is_bot == False].copy()
-    bot_ids = merged[merged.is_bot == True].slack_id.tolist()
-    
-    # Find users in Slack but not in HRIS (excluding bots)
-    slack_only_users = employee_data[employee_data[email_col].isna()].copy()
-    if len(slack_only_users) > 0:
-        unmapped_emails = slack_only_users['email_address'].dropna().tolist()
-        unmapped_count = len(unmapped_emails)
-        sample_emails = unmapped_emails[:5]
-        
-        error_msg = f"Found {unmapped_count} Slack user(s) that cannot be mapped to HRIS data.\n\n"
-        error_msg += "Sample unmapped emails:\n"
-        for email in sample_emails:
-            error_msg += f"  • {email}\n"
-        if unmapped_count > 5:
-            error_msg += f"  ... and {unmapped_count - 5} more\n"
-        error_msg += "\nPlease ensure all Slack users (except bots) exist in your HRIS CSV file."
-        raise ValueError(error_msg)
-    
-    # Find users in HRIS but not in Slack (warning, not error)
-    hris_only_users = employee_data[employee_data['slack_id'].isna()].copy()
-    if len(hris_only_users) > 0:
-        st.warning(f" {len(hris_only_users)} employee(s) in HRIS were not found in Slack export. They will be excluded from the anonymized data.")
-
-    # Keep only successfully mapped users
-    employee_data = employee_data[employee_data['slack_id'].notna() & employee_data[email_col].notna()].copy()
-    
-    if len(employee_data) == 0:
-        raise ValueError("No users could be matched between Slack export and HRIS data. Please check that emails match in both files.")
-
-    # Use one-way hashing (SHA-256) to generate Clarity_IDs - no reverse lookup possible
-    def generate_clarity_id(slack_id):
-        hash_object = hashlib.sha256(slack_id.encode())
-        hash_hex = hash_object.hexdigest()
-        # Take first 10 chars and prepend 'E' for employee
-        return "E" + hash_hex[:10].upper()
-    
-    employee_data["Clarity_ID"] = employee_data["slack_id"].apply(generate_clarity_id)
-
-    # Calculate Tenure_Band from Date_of_Hire if available
-    if "Date_of_Hire" in employee_data.columns:
-        def calculate_tenure_band(hire_date):
-            if pd.isna(hire_date):
-                return "Unknown"
-            try:
-                hire_dt = pd.to_datetime(hire_date)
-                tenure_days = (datetime.now() - hire_dt).days
-                
-                if tenure_days < 90:
-                    return "0-3mo"
-                elif tenure_days < 180:
-                    return "3-6mo"
-                elif tenure_days < 365:
-                    return "6-12mo"
-                elif tenure_days < 730:
-                    return "1-2yr"
-                elif tenure_days < 1825:
-                    return "2-5yr"
-                else:
-                    return "5+yr"
-            except:
-                return "Unknown"
-        
-        employee_data["Tenure_Band"] = employee_data["Date_of_Hire"].apply(calculate_tenure_band)
-
-    # Apply k-anonymity ONLY to Role and Team
-    anonymity_fields = ["Role", "Team"]
-    for field in anonymity_fields:
-        if field in employee_data.columns:
-            employee_data = apply_k_anonymity(employee_data, field, k=5)
-
-    return employee_data, bot_ids
+@st.cache_resource(max_entries=1, scope="session", on_release=InputArchive.close)
+def get_input_archive(file_id, _upload):
+    # One spooled, memory-mapped, indexed copy of the session's upload, shared by every rerun and both
+    # stages. It is closed when another export is uploaded or the session ends.
+    return InputArchive(_upload)
 
 
 @st.cache_resource
-def extract_zip_files(zip_uploaded_file, employee_data, list_of_bots_ids):
-    from collections import defaultdict
-    import os
-
-    employee_hashes = {}
-    for _, row in employee_data.iterrows():
-        employee_hashes[row["slack_id"]] = {
-            "Clarity_ID": row["Clarity_ID"],
-            "Team": row.get("Team") if "Team" in row else None,
-            "Role": row.get("Role") if "Role" in row else None,
-            "Timezone": row.get("timezone") if "timezone" in row else None,
-            "Work_Location": row.get("Work_Location") if "Work_Location" in row else None,
-            "Employment_Status": row.get("Employment_Status") if "Employment_Status" in row else None,
-            "Employment_Type": row.get("Employment_Type") if "Employment_Type" in row else None,
-            "Tenure_Band": row.get("Tenure_Band") if "Tenure_Band" in row else None,
-        }
-
-    output = {
-        "users": [],
-        "conversations": [],
-        "messages": defaultdict(lambda: defaultdict(list))  # {conv_id: {date: [messages]}}
-    }
-
-    with ZipFile(zip_uploaded_file, 'r') as zip_object:
-        files = [f for f in zip_object.namelist() if '__MACOSX' not in f]
-
-        channels = safe_json_read(zip_object, next((f for f in files if f.endswith("channels.json")), None))
-        groups = safe_json_read(zip_object, next((f for f in files if f.endswith("groups.json")), None)) if any(f.endswith("groups.json") for f in files) else []
-        dms = safe_json_read(zip_object, next((f for f in files if f.endswith("dms.json")), None)) if any(f.endswith("dms.json") for f in files) else []
-        mpims = safe_json_read(zip_object, next((f for f in files if f.endswith("mpims.json")), None)) if any(f.endswith("mpims.json") for f in files) else []
-        users_json = safe_json_read(zip_object, next((f for f in files if f.endswith("users.json")), None))
-
-    # USERS - include all metadata
-    for u in users_json:
-        emp_data = employee_hashes.get(u["id"])
-        if emp_data and u["id"] not in list_of_bots_ids:
-            output["users"].append(emp_data)
-
-    # CONVERSATIONS
-    dm_counter = 1
-    channel_counter = 1
-    conv_meta_list = dms + mpims + channels + groups
-    conv_id_map = {}  # Map original names to clarity IDs
-
-    def generate_conversation_id(conv_original_id, is_dm):
-        """Generate anonymized conversation ID using SHA-256 hashing"""
-        hash_object = hashlib.sha256(conv_original_id.encode())
-        hash_hex = hash_object.hexdigest()
-        # Take first 10 chars and prepend 'D' for DM or 'C' for channel
-        prefix = "D" if is_dm else "C"
-        return prefix + hash_hex[:10].upper()
-
-    for conv in conv_meta_list:
-        members = [
-            employee_hashes.get(m, {}).get("Clarity_ID")
-            for m in conv.get("members", [])
-            if employee_hashes.get(m) and m not in list_of_bots_ids
-        ]
-
-        if not members:
-            continue
-
-        is_dm = len(members) <= 3 or conv.get("is_im") or conv.get("is_mpim")
-        
-        # Use original conversation ID or name for hashing
-        original_conv_id = conv.get("id", conv.get("name", ""))
-        conv_id = generate_conversation_id(original_conv_id, is_dm)
-        conv_type = "dm" if is_dm else "channel"
-
-        conv_name = conv.get("name", conv.get("id", ""))
-        conv_id_map[conv_name] = conv_id
-
-        # Build conversation metadata
-        conv_data = {
-            "ConversationID": conv_id,
-            "Type": conv_type,
-            "Participants": ",".join(members),
-            "MemberCount": len(members),
-        }
-        
-        # Add created timestamp if present
-        if conv.get("created"):
-            conv_data["Created"] = conv.get("created")
-        
-        # Add creator (anonymized) if present
-        if conv.get("creator"):
-            creator_clarity = employee_hashes.get(conv.get("creator"), {}).get("Clarity_ID")
-            if creator_clarity:
-                conv_data["Creator"] = creator_clarity
-        
-        # Add archive status
-        if conv.get("is_archived") is not None:
-            conv_data["IsArchived"] = conv.get("is_archived")
-        
-        
-        output["conversations"].append(conv_data)
-
-    # MESSAGES - organized by conversation and date
-    with ZipFile(zip_uploaded_file, 'r') as zip_object:
-        folders = [f for f in zip_object.namelist() if f.endswith("/") and '__MACOSX' not in f]
-        
-        # Find all message files
-        message_files = [f for f in zip_object.namelist() if f.endswith(".json") and '__MACOSX' not in f 
-                        and not f.endswith("users.json") and not f.endswith("channels.json") 
-                        and not f.endswith("groups.json") and not f.endswith("dms.json") and not f.endswith("mpims.json")]
-        
-        if not message_files:
-            raise ValueError("No message files found in Slack export. Please ensure your export includes message history data.")
-
-        for folder in folders:
-            folder_name = folder.strip("/").split("/")[-1]
-            conv_id = conv_id_map.get(folder_name)
-
-            if not conv_id:
-                continue
-
-            for file in zip_object.namelist():
-                if file.startswith(folder) and file.endswith(".json") and '__MACOSX' not in file:
-                    try:
-                        # Extract date from filename
-                        date = os.path.basename(file).replace('.json', '')
-                        
-                        try:
-                            msgs = safe_json_read(zip_object, file)
-                        except Exception:
-                            # Skip malformed files without exposing paths
-                            continue
-                        
-                        if not msgs or not isinstance(msgs, list):
-                            continue
-                            
-                        for msg in msgs:
-                            if not isinstance(msg, dict):
-                                continue
-
-                            user_id = msg.get("user")
-                            if not user_id or user_id in list_of_bots_ids + ['USLACKBOT']:
-                                continue
-
-                            clarity = employee_hashes.get(user_id, {}).get("Clarity_ID")
-                            if not clarity:
-                                continue
-
-                            # Create anonymized message in Slack format with rounded timestamps
-                            anonymized_msg = {
-                                'user': clarity,
-                                'ts': round_timestamp(msg.get('ts', '0'))
-                            }
-                            
-                            # Add edited metadata if present
-                            if msg.get('edited'):
-                                edited_info = {}
-                                if msg['edited'].get('ts'):
-                                    edited_info['ts'] = round_timestamp(msg['edited'].get('ts'))
-                                if msg['edited'].get('user'):
-                                    editor_clarity = employee_hashes.get(msg['edited'].get('user'), {}).get('Clarity_ID')
-                                    if editor_clarity:
-                                        edited_info['user'] = editor_clarity
-                                if edited_info:
-                                    anonymized_msg['edited'] = edited_info
-
-                            # Add thread_ts if present (rounded)
-                            if msg.get('thread_ts'):
-                                anonymized_msg['thread_ts'] = round_timestamp(msg.get('thread_ts'))
-                            
-                            # Add latest_reply if present (rounded)
-                            if msg.get('latest_reply'):
-                                anonymized_msg['latest_reply'] = round_timestamp(msg.get('latest_reply'))
-                            
-                            # Add reply_count if present
-                            if msg.get('reply_count'):
-                                anonymized_msg['reply_count'] = msg.get('reply_count')
-                            
-                            # Add reply_users_count if present
-                            if msg.get('reply_users_count'):
-                                anonymized_msg['reply_users_count'] = msg.get('reply_users_count')
-                            
-                            # Add reply_users if present (anonymize user IDs)
-                            if msg.get('reply_users'):
-                                anonymized_reply_users = []
-                                for reply_user_id in msg.get('reply_users', []):
-                                    if reply_user_id not in list_of_bots_ids:
-                                        clarity_user = employee_hashes.get(reply_user_id, {}).get('Clarity_ID')
-                                        if clarity_user:
-                                            anonymized_reply_users.append(clarity_user)
-                                if anonymized_reply_users:
-                                    anonymized_msg['reply_users'] = anonymized_reply_users
-                            
-                            # Add replies metadata if present (anonymize user IDs)
-                            if msg.get('replies'):
-                                anonymized_replies = []
-                                for reply in msg.get('replies', []):
-                                    reply_user = reply.get('user')
-                                    if reply_user and reply_user not in list_of_bots_ids:
-                                        clarity_user = employee_hashes.get(reply_user, {}).get('Clarity_ID')
-                                        if clarity_user:
-                                            anonymized_replies.append({
-                                                'user': clarity_user,
-                                                'ts': round_timestamp(reply.get('ts', '0'))
-                                            })
-                                if anonymized_replies:
-                                    anonymized_msg['replies'] = anonymized_replies
-
-                            # Add reactions if present (with anonymized users, no reaction types)
-                            if msg.get('reactions'):
-                                anonymized_reactions = []
-                                for reaction in msg.get('reactions', []):
-                                    anonymized_users = [
-                                        employee_hashes.get(u, {}).get('Clarity_ID')
-                                        for u in reaction.get('users', [])
-                                        if u not in list_of_bots_ids and employee_hashes.get(u)
-                                    ]
-                                    if anonymized_users:
-                                        anonymized_reactions.append({
-                                            'count': len(anonymized_users),
-                                            'users': anonymized_users
-                                        })
-                                if anonymized_reactions:
-                                    anonymized_msg['reactions'] = anonymized_reactions
-                            
-                            # Add last_read if present
-                            if msg.get('last_read'):
-                                anonymized_msg['last_read'] = msg.get('last_read')
-
-                            output["messages"][conv_id][date].append(anonymized_msg)
-
-                    except Exception:
-                        # Skip problematic files silently - don't expose internal details
-                        continue
-    
-    # Validate that we have some messages
-    total_messages = sum(sum(len(msgs) for msgs in dates.values()) for dates in output.get('messages', {}).values())
-    if total_messages == 0:
-        raise ValueError("No messages were found or processed. Please ensure:\n"
-                        "  1. Your Slack export contains message files\n"
-                        "  2. Users in messages match users in your HRIS CSV\n"
-                        "  3. The export includes actual conversation data (not just user/channel lists)")
-
-    return output
+def get_result_cache():
+    # One cache object per server; the archives themselves live on disk
+    return ResultCache(
+        os.environ.get("PII_SANITIZER_CACHE_DIR", DEFAULT_CACHE_DIR),
+        int(os.environ.get("PII_SANITIZER_CACHE_MB", DEFAULT_CACHE_MAX_BYTES // (1024 * 1024))) * 1024 * 1024,
+    )
 
 
 def scrub_secrets(data):
@@ -463,8 +73,19 @@ def main():
     
     st.divider()
     
+    # Timings and counts of this run, shown after anonymization and written into the archive
+    report = ProcessingReport()
+
+    running = st.session_state.get("job")
+    if running is not None and running["run_id"][0] != zip_uploaded_file.file_id:
+        # The job reads the previous upload, whose archive is closed once the new one is opened
+        discard_run(st.session_state)
+        running["job"].join()
+
     try:
-        df, bot_ids = combine_data(uploaded_file, zip_uploaded_file)
+        export_archive = get_input_archive(zip_uploaded_file.file_id, zip_uploaded_file)
+        report.add_time("zip_open_index", export_archive.open_seconds)
+        df, bot_ids = combine_data(uploaded_file, export_archive, report=report)
         
         # Show data preview
         st.success(f"Data loaded: {len(df)} employees, {len(bot_ids)} bots detected")
@@ -488,91 +109,263 @@ def main():
 
     st.divider()
     
-    if st.button("Anonymize Slack Data", type="primary", use_container_width=True):
-        try:
-            with st.spinner("Scrubbing your secrets..."):
-                output_data = extract_zip_files(zip_uploaded_file, df, bot_ids)
-
-            message_count = sum(
-                sum(len(msgs) for msgs in dates.values())
-                for dates in output_data.get('messages', {}).values()
+    state = st.session_state
+    # Options stay as they are until the running job is finished or cancelled
+    job_running = state.get("job") is not None and state["job"]["job"].running
+
+    with st.expander("Output options"):
+        if job_running:
+            st.caption("Options are locked while the export is being anonymized.")
+        workers = st.number_input(
+            "Parallel workers",
+            min_value=1,
+            max_value=os.cpu_count() or 1,
+            value=1,
+            help="Number of processes used to anonymize messages. Output is identical for any value.",
+            disabled=job_running,
+        )
+        output_formats = available_output_formats()
+        output_format = st.selectbox(
+            "Output format",
+            output_formats,
+            index=output_formats.index(DEFAULT_OUTPUT_FORMAT),
+            help="json: one file per conversation and day. parquet/ndjson: users, conversations and "
+            "messages as three tables (one row per message) for analytics tools.",
+            disabled=job_running,
+        )
+        compact = st.checkbox(
+            "Compact JSON output",
+            value=False,
+            help="Write files without indentation for a smaller, faster export.",
+            disabled=job_running,
+        )
+        aggregates = st.checkbox(
+            "Interaction aggregates",
+            value=False,
+            help="Also write reply and reaction edge lists, messages per user per day and thread sizes "
+            "under aggregates/, so network analysis does not have to read every message file.",
+            disabled=job_running,
+        )
+        compression = st.selectbox(
+            "Compression",
+            list(COMPRESSION_METHODS),
+            index=list(COMPRESSION_METHODS).index(DEFAULT_COMPRESSION),
+            help="LZMA gives the smallest download but is not supported by every unzip tool.",
+            disabled=job_running,
+        )
+        compression_level = st.slider(
+            "Compression level",
+            min_value=0,
+            max_value=9,
+            value=6,
+            disabled=job_running or compression == "stored",
+        )
+        compress_threads = st.number_input(
+            "Compression threads",
+            min_value=1,
+            max_value=os.cpu_count() or 1,
+            value=min(4, os.cpu_count() or 1),
+            disabled=job_running,
+        )
+
+    # The uploads and options a job or result belongs to
+    run_id = (
+        zip_uploaded_file.file_id, uploaded_file.file_id, compact, compression, compression_level, output_format, aggregates
+    )
+
+    if st.button("Anonymize Slack Data", type="primary", use_container_width=True, disabled=job_running):
+        discard_run(state)
+        result_cache = get_result_cache()
+        # workers and compress_threads do not change the archive, so they are not part of the key
+        key = cache_key(zip_uploaded_file, uploaded_file, {
+            "compact": compact,
+            "compression": compression,
+            "compression_level": compression_level,
+            "output_format": output_format,
+            "aggregates": aggregates,
+        })
+        cached = result_cache.get(key)
+
+        if cached is not None:
+            archive_file, summary = cached
+            state["result"] = {"run_id": run_id, "summary": summary, "output_file": archive_file, "cached": True}
+        else:
+            # Small archives stay in memory, large ones are spooled to a temporary file
+            output_file = spooled_output_file()
+            # Runs in a background thread; the page keeps updating while it works
+            job = BackgroundJob(
+                stream_anonymized_export,
+                export_archive,
+                df,
+                bot_ids,
+                output_file,
+                workers=int(workers),
+                compact=compact,
+                compression=compression,
+                compression_level=compression_level,
+                compress_threads=int(compress_threads),
+                report=report,
+                output_format=output_format,
+                aggregates=aggregates,
             )
-        except ValueError as e:
-            st.error(f"{str(e)}")
+            try:
+                # Built while the job already works through the whole export
+                with st.spinner("Preparing a preview..."):
+                    preview = preview_anonymized_export(export_archive, df, bot_ids)
+            except Exception:
+                # The job reports the same problem once it gets there
+                preview = None
+            state["job"] = {"run_id": run_id, "key": key, "preview": preview, "output_file": output_file, "job": job}
+
+    running = state.get("job")
+    if running is not None:
+        if running["job"].running:
+            show_progress(running["job"])
+            if running["preview"] is not None:
+                show_previews(
+                    running["preview"],
+                    f"Preview of the first {PREVIEW_DAY_FILES} day files; the full export is still being anonymized.",
+                )
             return
-        except Exception:
-            st.error("An error occurred during anonymization. Please ensure your Slack export is complete and valid.")
+        del state["job"]
+        if not finish_job(state, running):
             return
-        
-        # Display summary
-        st.success("Anonymization complete!")
-        
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("Users", len(output_data["users"]))
-        with col2:
-            st.metric("Conversations", len(output_data["conversations"]))
-        with col3:
-            st.metric("Messages", message_count)
-        
-        # Preview tabs
-        tab1, tab2, tab3 = st.tabs(["Users Preview", "Conversations Preview", "Messages Preview"])
-        
-        with tab1:
-            st.json(scrub_secrets(output_data["users"][:3]))
-            st.caption(f"Showing 3 of {len(output_data['users'])} users")
-        
-        with tab2:
-            st.json(scrub_secrets(output_data["conversations"][:3]))
-            st.caption(f"Showing 3 of {len(output_data['conversations'])} conversations")
-        
-        with tab3:
-            # Get first conversation with messages
-            sample_messages = []
-            for conv_id, dates in output_data.get('messages', {}).items():
-                for date, messages in dates.items():
-                    if messages:
-                        sample_messages = messages[:3]
-                        st.write(f"**Sample from:** `{conv_id}` on `{date}`")
-                        break
-                if sample_messages:
-                    break
-            
-            if sample_messages:
-                st.json(scrub_secrets(sample_messages))
-                st.caption("Showing 3 sample messages (no text content included)")
-            else:
-                st.info("No messages found")
-        
-        st.divider()
-
-        # Build ZIP with organized structure
-        try:
-            from io import BytesIO
-            zip_buffer = BytesIO()
-            with ZipFile(zip_buffer, "w") as zipf:
-                zipf.writestr("users.json", json.dumps(output_data["users"], indent=2))
-                zipf.writestr("conversations.json", json.dumps(output_data["conversations"], indent=2))
-                
-                # Write messages organized by conversation and date
-                for conv_id, dates in output_data.get('messages', {}).items():
-                    for date, messages in dates.items():
-                        if messages:
-                            file_path = f"messages/{conv_id}/{date}.json"
-                            zipf.writestr(file_path, json.dumps(messages, indent=2))
-
-            zip_buffer.seek(0)
-            st.download_button(
-                "Download Anonymized Slack Export",
-                zip_buffer.getvalue(),
-                "anonymized_slack_export.zip",
-                "application/zip",
-                type="primary",
-                use_container_width=True
+
+    result = state.get("result")
+    if result is not None:
+        if result["run_id"] != run_id:
+            st.info(
+                "The uploads or output options changed since this export was anonymized. "
+                "Click \"Anonymize Slack Data\" to create an export with the current ones."
             )
-        except Exception:
-            st.error("Unable to create download file. Please try again.")
-            return
+        show_result(result)
+
+
+def discard_run(state):
+    """Cancel the running job and drop the previous result of this session."""
+    running = state.pop("job", None)
+    if running is not None:
+        # The job stops at its next day file; its output file is released with it
+        running["job"].cancel()
+    result = state.pop("result", None)
+    if result is not None:
+        result["output_file"].close()
+
+
+def finish_job(state, running):
+    """Turn a finished job into the session's result. Returns False when there is nothing to show."""
+    job = running["job"]
+    if job.state == "done":
+        summary = job.result
+        del summary["manifest"]
+        get_result_cache().put(running["key"], running["output_file"], summary)
+        state["result"] = {"run_id": running["run_id"], "summary": summary, "output_file": running["output_file"], "cached": False}
+        return True
+
+    running["output_file"].close()
+    if job.state == "cancelled":
+        st.warning("Anonymization cancelled.")
+    elif isinstance(job.error, ValueError):
+        st.error(f"{str(job.error)}")
+    else:
+        st.error("An error occurred during anonymization. Please ensure your Slack export is complete and valid.")
+    return False
+
+
+@st.fragment(run_every=PROGRESS_REFRESH_SECONDS)
+def show_progress(job):
+    if not job.running:
+        # Show the finished run on the whole page
+        st.rerun()
+
+    status = job.status()
+    text = (
+        f"{status.get('day_files_done', 0)} of {status.get('day_files_total', 0)} day files, "
+        f"{status.get('conversations_done', 0)} of {status.get('conversations_total', 0)} conversations"
+    )
+    if status["eta_seconds"] is not None:
+        text += f", about {status['eta_seconds']:.0f} s left"
+    st.progress(status["fraction"], text=text)
+
+    if status["cancelling"]:
+        st.caption("Cancelling...")
+    elif st.button("Cancel"):
+        job.cancel()
+
+
+def show_previews(summary, caption=None):
+    if caption:
+        st.caption(caption)
+
+    tab1, tab2, tab3 = st.tabs(["Users Preview", "Conversations Preview", "Messages Preview"])
+    
+    with tab1:
+        st.json(scrub_secrets(summary["users"][:3]))
+        st.caption(f"Showing 3 of {len(summary['users'])} users")
+    
+    with tab2:
+        st.json(scrub_secrets(summary["conversations"][:3]))
+        st.caption(f"Showing 3 of {len(summary['conversations'])} conversations")
+    
+    with tab3:
+        # First conversation with messages, captured while streaming
+        sample = summary["sample"]
+        if sample:
+            st.write(f"**Sample from:** `{sample['conversation']}` on `{sample['date']}`")
+            st.json(scrub_secrets(sample["messages"]))
+            st.caption("Showing 3 sample messages (no text content included)")
+        else:
+            st.info("No messages found")
+
+
+def show_result(result):
+    summary = result["summary"]
+    output_file = result["output_file"]
+
+    # Display summary
+    st.success("Anonymization complete!")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Users", len(summary["users"]))
+    with col2:
+        st.metric("Conversations", len(summary["conversations"]))
+    with col3:
+        st.metric("Messages", summary["message_count"])
+
+    cache_stats = get_result_cache().stats()
+    st.caption(
+        ("Served from cache. " if result["cached"] else "")
+        + f"Result cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+        f"{cache_stats['entries']} entries ({cache_stats['bytes'] / (1024 * 1024):.1f} MB)"
+    )
+
+    processing_report = summary.get("report")
+    if processing_report:
+        with st.expander("Processing report"):
+            dropped = processing_report["dropped_messages"]
+            if dropped:
+                st.write("**Dropped messages:** " + ", ".join(f"{reason}: {count}" for reason, count in dropped.items()))
+            st.json(processing_report)
+            st.caption(f"Also included in the download as {REPORT_NAME}. Contains timings and counts only.")
+    
+    show_previews(summary)
+    
+    st.divider()
+
+    try:
+        # Streamlit keeps download payloads in memory, so this is the only full copy
+        output_file.seek(0)
+        st.download_button(
+            "Download Anonymized Slack Export",
+            output_file.read(),
+            "anonymized_slack_export.zip",
+            "application/zip",
+            type="primary",
+            use_container_width=True
+        )
+    except Exception:
+        st.error("Unable to create download file. Please try again.")
 
 
 if __name__ == "__main__":
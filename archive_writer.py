@@ -0,0 +1,224 @@
+"""
+Output archive writer with selectable compression.
+
+Entries are compressed in a thread pool (zlib and lzma release the GIL while
+compressing) and appended to the archive in the order they were written, so
+the archive layout does not depend on the number of threads.
+"""
+import lzma
+import struct
+import tempfile
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from zipfile import ZIP64_LIMIT, ZIP_DEFLATED, ZIP_LZMA, ZIP_STORED, BadZipFile, ZipFile, ZipInfo
+
+COMPRESSION_METHODS = {
+    "deflate": ZIP_DEFLATED,
+    "lzma": ZIP_LZMA,
+    "stored": ZIP_STORED,
+}
+DEFAULT_COMPRESSION = "deflate"
+
+# Archives up to this size stay in memory, larger ones roll over to a temporary file
+SPOOL_MAX_BYTES = 32 * 1024 * 1024
+
+# Compressed entries waiting to be appended, per compression thread
+PENDING_ENTRIES_PER_THREAD = 4
+
+# Flag bits of an entry: encrypted, and LZMA stream ending with an end-of-stream marker
+_ENCRYPTED = 0x01
+_LZMA_EOS_MARKER = 0x02
+
+# Fixed part of a ZIP local file header, followed by the name and extra field
+_LOCAL_HEADER_SIZE = 30
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+def raw_writes_supported(zipf, compress_type):
+    """
+    Whether this Python's zipfile (and lzma) still have the private members
+    that read_raw_entry, compress_entry and ArchiveWriter._append rely on.
+    Without them entries are written through ZipFile.writestr instead.
+    """
+    if compress_type == ZIP_LZMA and not hasattr(lzma, "_encode_filter_properties"):
+        return False
+    return hasattr(ZipInfo, "FileHeader") and all(
+        hasattr(zipf, attr)
+        for attr in ("_lock", "_seekable", "_writecheck", "_didModify", "fp", "start_dir", "filelist", "NameToInfo")
+    )
+
+
+def spooled_output_file():
+    """Temporary file for an output archive that spills to disk once it grows large."""
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+
+
+def read_raw_entry(source, info):
+    """Return the stored (still compressed) bytes of an entry of an open archive."""
+    with source._lock:
+        source.fp.seek(info.header_offset)
+        header = source.fp.read(_LOCAL_HEADER_SIZE)
+        if header[:4] != _LOCAL_HEADER_SIGNATURE:
+            raise BadZipFile("Bad magic number for file header")
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        source.fp.seek(info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length)
+        return source.fp.read(info.compress_size)
+
+
+def compress_entry(data, compress_type, level=None):
+    """Return (crc, compressed bytes) for one archive entry."""
+    crc = zlib.crc32(data)
+
+    if compress_type == ZIP_DEFLATED:
+        compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION if level is None else level, zlib.DEFLATED, -15
+        )
+        return crc, compressor.compress(data) + compressor.flush()
+
+    if compress_type == ZIP_LZMA:
+        lzma_filter = {"id": lzma.FILTER_LZMA1, "preset": lzma.PRESET_DEFAULT if level is None else level}
+        props = lzma._encode_filter_properties(lzma_filter)
+        compressor = lzma.LZMACompressor(lzma.FORMAT_RAW, filters=[lzma_filter])
+        # ZIP LZMA entries start with the LZMA SDK version and the encoded filter properties
+        header = struct.pack("<BBH", 9, 4, len(props)) + props
+        return crc, header + compressor.compress(data) + compressor.flush()
+
+    return crc, data
+
+
+class ArchiveWriter:
+    """
+    Write entries to a ZIP archive, compressing them with `threads` worker
+    threads. compression is one of COMPRESSION_METHODS and level is the
+    DEFLATE level (0-9) or LZMA preset (0-9).
+    """
+
+    def __init__(self, output_file, compression=DEFAULT_COMPRESSION, level=None, threads=1):
+        if compression not in COMPRESSION_METHODS:
+            raise ValueError(f"Unsupported compression '{compression}'. Choose one of: {', '.join(COMPRESSION_METHODS)}")
+        if level is not None and not 0 <= level <= 9:
+            raise ValueError("Compression level must be between 0 and 9.")
+
+        self._compress_type = COMPRESSION_METHODS[compression]
+        self._level = level
+        self._zipf = ZipFile(output_file, "w", compression=self._compress_type)
+        # All entries of one archive share the time it was started
+        self._date_time = time.localtime(time.time())[:6]
+        self._raw_writes = raw_writes_supported(self._zipf, self._compress_type)
+        # Entries are only compressed in threads when they can be appended precompressed
+        self._executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 and self._raw_writes else None
+        self._max_pending = threads * PENDING_ENTRIES_PER_THREAD
+        self._pending = deque()
+
+    def writestr(self, name, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        if not self._raw_writes:
+            self._zipf.writestr(self._zinfo(name), data, compresslevel=self._level)
+            return
+
+        if self._executor is None:
+            self._append(name, len(data), *compress_entry(data, self._compress_type, self._level))
+            return
+
+        future = self._executor.submit(compress_entry, data, self._compress_type, self._level)
+        self._pending.append((name, len(data), future))
+        while len(self._pending) >= self._max_pending:
+            self._append_next()
+
+    def copy_entry(self, source, name):
+        """
+        Copy an entry from another open archive. When both use the same
+        compression the stored bytes are copied as they are, without
+        decompressing and compressing them again.
+        """
+        info = source.getinfo(name)
+        if (
+            info.compress_type != self._compress_type
+            or info.flag_bits & _ENCRYPTED
+            or not self._raw_writes
+            or not hasattr(source, "_lock")
+        ):
+            self.writestr(name, source.read(name))
+            return
+
+        compressed = read_raw_entry(source, info)
+        if self._executor is None:
+            self._append(name, info.file_size, info.CRC, compressed)
+            return
+
+        # Queue behind entries still being compressed so the archive order is kept
+        future = Future()
+        future.set_result((info.CRC, compressed))
+        self._pending.append((name, info.file_size, future))
+        while len(self._pending) >= self._max_pending:
+            self._append_next()
+
+    def open_entry(self, name):
+        """
+        Open an entry for streaming writes, for content too large to pass to
+        writestr at once. It is compressed on the calling thread (LZMA with
+        the default preset), and no other entry can be written until the
+        returned file is closed.
+        """
+        self.flush()
+        return self._zipf.open(self._zinfo(name), "w", force_zip64=True)
+
+    def flush(self):
+        """Wait for entries still being compressed and append them to the archive."""
+        while self._pending:
+            self._append_next()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+            self._zipf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            # Drop queued entries; the archive is discarded by the caller anyway
+            self._pending.clear()
+        self.close()
+
+    def _zinfo(self, name):
+        zinfo = ZipInfo(filename=name, date_time=self._date_time)
+        zinfo.compress_type = self._compress_type
+        zinfo._compresslevel = self._level
+        zinfo.external_attr = 0o600 << 16
+        return zinfo
+
+    def _append_next(self):
+        name, file_size, future = self._pending.popleft()
+        self._append(name, file_size, *future.result())
+
+    def _append(self, name, file_size, crc, compressed):
+        # Equivalent to ZipFile.writestr, but with the entry compressed up front
+        zinfo = self._zinfo(name)
+        zinfo.file_size = file_size
+        zinfo.compress_size = len(compressed)
+        zinfo.CRC = crc
+        if self._compress_type == ZIP_LZMA:
+            zinfo.flag_bits |= _LZMA_EOS_MARKER
+        zip64 = file_size > ZIP64_LIMIT or zinfo.compress_size > ZIP64_LIMIT
+
+        zipf = self._zipf
+        with zipf._lock:
+            if zipf._seekable:
+                zipf.fp.seek(zipf.start_dir)
+            zinfo.header_offset = zipf.fp.tell()
+            zipf._writecheck(zinfo)
+            zipf._didModify = True
+            zipf.fp.write(zinfo.FileHeader(zip64))
+            zipf.fp.write(compressed)
+            zipf.start_dir = zipf.fp.tell()
+            zipf.filelist.append(zinfo)
+            zipf.NameToInfo[zinfo.filename] = zinfo
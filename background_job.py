@@ -0,0 +1,84 @@
+"""
+Run a long pipeline call in a background thread, so the Streamlit script can
+keep rendering (progress, cancel button, preview) while it works.
+
+The function must accept a progress callback: it is called with a dict of
+counters as work advances and raises JobCancelled once cancel() was
+requested, which unwinds the function like any other error.
+"""
+import threading
+import time
+
+
+class JobCancelled(Exception):
+    """Raised from the progress callback of a job that was cancelled."""
+
+
+class BackgroundJob:
+    """
+    Call function(*args, progress=callback, **kwargs) in a daemon thread.
+
+    state is "running", then "done" (result holds the return value),
+    "failed" (error holds the exception) or "cancelled".
+    """
+
+    def __init__(self, function, *args, **kwargs):
+        self.state = "running"
+        self.result = None
+        self.error = None
+        self._progress = {}
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._started = time.monotonic()
+        self._finished = None
+        self._thread = threading.Thread(
+            target=self._run, args=(function, args, {**kwargs, "progress": self._update}), daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def running(self):
+        return self.state == "running"
+
+    def cancel(self):
+        self._cancel.set()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+        return not self.running
+
+    def status(self):
+        """
+        Latest progress counters plus state, elapsed_seconds, fraction (of
+        day files done) and eta_seconds (None until the first file is done).
+        """
+        with self._lock:
+            status = dict(self._progress)
+        elapsed = (self._finished or time.monotonic()) - self._started
+        done = status.get("day_files_done", 0)
+        total = status.get("day_files_total", 0)
+        status["state"] = self.state
+        status["cancelling"] = self.running and self._cancel.is_set()
+        status["elapsed_seconds"] = elapsed
+        status["fraction"] = min(done / total, 1.0) if total else 0.0
+        # Assumes the remaining day files take as long on average as the finished ones
+        status["eta_seconds"] = elapsed / done * (total - done) if done and self.running else None
+        return status
+
+    def _update(self, progress):
+        if self._cancel.is_set():
+            raise JobCancelled()
+        with self._lock:
+            self._progress = dict(progress)
+
+    def _run(self, function, args, kwargs):
+        try:
+            self.result = function(*args, **kwargs)
+            state = "done"
+        except JobCancelled:
+            state = "cancelled"
+        except Exception as e:
+            self.error = e
+            state = "failed"
+        self._finished = time.monotonic()
+        self.state = state
@@ -0,0 +1,198 @@
+"""
+Headless batch entry point: anonymize a Slack export without the Streamlit UI.
+
+    python batch.py HRIS.csv slack_export.zip -o anonymized_slack_export.zip
+
+Each run also writes <output>.manifest.json. Pass the previous output with
+--previous to reuse the day files that have not changed since that run.
+"""
+import argparse
+import os
+import sys
+import time
+
+from archive_writer import COMPRESSION_METHODS, DEFAULT_COMPRESSION
+from manifest import load_manifest, manifest_path, save_manifest
+from memory_usage import peak_rss_mb
+from pipeline import InputArchive, combine_data, stream_anonymized_export
+from processing_report import ProcessingReport
+from table_output import DEFAULT_OUTPUT_FORMAT, available_output_formats
+
+
+def run_batch(
+    hris_path,
+    export_path,
+    output_path,
+    workers=1,
+    compact=False,
+    compression=DEFAULT_COMPRESSION,
+    compression_level=None,
+    compress_threads=1,
+    k_combinations=None,
+    previous_path=None,
+    warn=None,
+    output_format=DEFAULT_OUTPUT_FORMAT,
+    aggregates=False,
+):
+    """
+    Anonymize the export at export_path using the HRIS CSV at hris_path and
+    write the anonymized archive to output_path, with its manifest next to it.
+    previous_path is an earlier output whose unchanged day files are reused.
+    output_format is "json", "parquet" or "ndjson" (see table_output).
+    aggregates adds the interaction tables (see interaction_aggregates).
+    Returns run statistics.
+    """
+    start = time.perf_counter()
+    report = ProcessingReport()
+
+    previous_manifest = None
+    if previous_path is not None and output_format != "json":
+        if warn:
+            warn("Unchanged day files are only reused for the json format; anonymizing every day file.")
+        previous_path = None
+    if previous_path is not None:
+        previous_manifest = load_manifest(manifest_path(previous_path))
+        if not os.path.exists(previous_path) or previous_manifest is None:
+            if warn:
+                warn(f"No usable manifest for {previous_path}; anonymizing every day file.")
+            previous_path, previous_manifest = None, None
+
+    # The export is opened and indexed once and shared by both stages
+    with open(hris_path, "rb") as hris_file, InputArchive(export_path, report) as export_archive:
+        employee_data, bot_ids = combine_data(
+            hris_file, export_archive, warn=warn, k_combinations=k_combinations, report=report
+        )
+
+        # Write next to the destination and rename, so a failed run never leaves a partial archive
+        partial_path = output_path + ".partial"
+        try:
+            with open(partial_path, "wb") as output_file:
+                summary = stream_anonymized_export(
+                    export_archive,
+                    employee_data,
+                    bot_ids,
+                    output_file,
+                    workers=workers,
+                    compact=compact,
+                    compression=compression,
+                    compression_level=compression_level,
+                    compress_threads=compress_threads,
+                    previous_archive=previous_path,
+                    previous_manifest=previous_manifest,
+                    report=report,
+                    output_format=output_format,
+                    aggregates=aggregates,
+                )
+            os.replace(partial_path, output_path)
+            save_manifest(summary["manifest"], manifest_path(output_path))
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    elapsed = time.perf_counter() - start
+    export_mb = os.path.getsize(export_path) / (1024 * 1024)
+
+    return {
+        "users": len(summary["users"]),
+        "conversations": len(summary["conversations"]),
+        "day_files": summary["day_file_count"],
+        "messages": summary["message_count"],
+        "reused_day_files": summary["reused_day_files"],
+        "seconds": elapsed,
+        "files_per_second": summary["day_file_count"] / elapsed if elapsed else 0.0,
+        "messages_per_second": summary["message_count"] / elapsed if elapsed else 0.0,
+        "mb_per_second": export_mb / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": summary["report"]["stages_seconds"],
+        "dropped_messages": summary["report"]["dropped_messages"],
+        "dropped_day_files": summary["report"]["dropped_day_files"],
+    }
+
+
+def format_stats(stats):
+    peak_rss = f"{stats['peak_rss_mb']:.1f} MB" if stats["peak_rss_mb"] is not None else "n/a"
+    return "\n".join([
+        f"Users:          {stats['users']}",
+        f"Conversations:  {stats['conversations']}",
+        f"Day files:      {stats['day_files']}",
+        f"Messages:       {stats['messages']}",
+        f"Reused:         {stats['reused_day_files']} unchanged day files",
+        f"Elapsed:        {stats['seconds']:.2f} s",
+        f"Throughput:     {stats['files_per_second']:.1f} files/s, "
+        f"{stats['messages_per_second']:.1f} messages/s, {stats['mb_per_second']:.2f} MB/s",
+        f"Peak RSS:       {peak_rss}",
+        f"Stages:         {_format_counts(stats['stages'], '{:.2f} s')}",
+        f"Dropped msgs:   {_format_counts(stats['dropped_messages'])}",
+        f"Dropped files:  {_format_counts(stats['dropped_day_files'])}",
+    ])
+
+
+def _format_counts(counts, value_format="{}"):
+    return ", ".join(f"{name} {value_format.format(value)}" for name, value in counts.items()) or "none"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Anonymize a Slack export without the Streamlit UI.")
+    parser.add_argument("hris", help="HRIS CSV file with an email column")
+    parser.add_argument("export", help="Original Slack workspace export ZIP")
+    parser.add_argument("-o", "--output", default="anonymized_slack_export.zip", help="Anonymized archive to write")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Processes used to anonymize messages")
+    parser.add_argument("--compact", action="store_true", help="Write JSON without indentation")
+    parser.add_argument(
+        "--format",
+        choices=available_output_formats(),
+        default=DEFAULT_OUTPUT_FORMAT,
+        help="json: one file per conversation and day; parquet/ndjson: users, conversations and messages tables",
+    )
+    parser.add_argument(
+        "--aggregates",
+        action="store_true",
+        help="Also write reply/reaction edge lists, messages per user per day and thread sizes under aggregates/",
+    )
+    parser.add_argument("--compression", choices=list(COMPRESSION_METHODS), default=DEFAULT_COMPRESSION)
+    parser.add_argument("--level", type=int, choices=range(10), metavar="0-9", help="DEFLATE level or LZMA preset")
+    parser.add_argument("--compress-threads", type=int, default=1, help="Threads used to compress archive entries")
+    parser.add_argument(
+        "--k-combination",
+        action="append",
+        type=lambda value: tuple(column.strip() for column in value.split(",")),
+        metavar="COL1,COL2",
+        help="Also enforce k-anonymity on this column combination (repeatable)",
+    )
+    parser.add_argument(
+        "--previous",
+        metavar="PREVIOUS.zip",
+        help="Earlier anonymized archive (with its .manifest.json) whose unchanged day files are reused",
+    )
+    args = parser.parse_args(argv)
+
+    def warn(message):
+        print(f"Warning: {message.strip()}", file=sys.stderr)
+
+    try:
+        stats = run_batch(
+            args.hris,
+            args.export,
+            args.output,
+            workers=args.workers,
+            compact=args.compact,
+            compression=args.compression,
+            compression_level=args.level,
+            compress_threads=args.compress_threads,
+            k_combinations=args.k_combination,
+            previous_path=args.previous,
+            warn=warn,
+            output_format=args.format,
+            aggregates=args.aggregates,
+        )
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Anonymized export written to {args.output}")
+    print(format_stats(stats))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""
+Benchmark the Slack and CSV pipelines on synthetic data and record a JSON
+baseline that later runs can be compared against. Runs fully offline.
+
+    python benchmark.py --users 10000 --channels 5000 --messages 1000000 -o baseline.json
+    python benchmark.py --users 10000 --channels 5000 --messages 1000000 --compare baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import partial
+
+from archive_writer import ArchiveWriter
+from memory_usage import current_rss_mb, peak_rss_mb
+from pipeline import combine_data, dumps_json, extract_zip_files, stream_anonymized_export
+from presidio_setup import create_presidio_engines
+from synthetic_export import generate_notes_csv, generate_slack_export
+
+BENCHMARK_VERSION = 1
+
+# How often memory is sampled while a stage runs
+RSS_SAMPLE_SECONDS = 0.01
+
+# A stage counts as a regression when it is this much slower than the baseline
+DEFAULT_TOLERANCE = 0.2
+
+
+@contextmanager
+def measure(stages, name):
+    """Record wall time and peak RSS of the block as stages[name]."""
+    samples = [current_rss_mb() or 0.0]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(RSS_SAMPLE_SECONDS):
+            samples.append(current_rss_mb() or 0.0)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    result = {}
+    try:
+        yield result
+    finally:
+        elapsed = time.perf_counter() - start
+        done.set()
+        sampler.join()
+        samples.append(current_rss_mb() or 0.0)
+        stages[name] = {
+            "seconds": elapsed,
+            "peak_rss_mb": max(samples),
+            "rss_growth_mb": max(samples) - samples[0],
+            # Counts the stage filled in, turned into per-second rates
+            **{f"{unit}_per_second": count / elapsed if elapsed else 0.0 for unit, count in result.items()},
+        }
+
+
+def write_message_archive(output, output_file):
+    """Build the output ZIP from extract_zip_files output, as the in-memory path does."""
+    with ArchiveWriter(output_file) as zipf:
+        zipf.writestr("users.json", dumps_json(output["users"]))
+        zipf.writestr("conversations.json", dumps_json(output["conversations"]))
+        for conv_id, date, msgs in output["messages"].iter_days():
+            zipf.writestr(f"messages/{conv_id}/{date}.json", dumps_json(msgs))
+
+
+def run_benchmark(
+    work_dir,
+    users=1000,
+    channels=200,
+    messages=100_000,
+    csv_rows=20_000,
+    workers=1,
+    model="none",
+    seed=0,
+):
+    """Generate data in work_dir, time every stage and return the results."""
+    export_path = os.path.join(work_dir, "export.zip")
+    hris_path = os.path.join(work_dir, "hris.csv")
+    notes_path = os.path.join(work_dir, "notes.csv")
+    stages = {}
+
+    start = time.perf_counter()
+    written = generate_slack_export(export_path, hris_path, users=users, channels=channels, messages=messages, seed=seed)
+    generate_notes_csv(notes_path, rows=csv_rows, seed=seed)
+    generate_seconds = time.perf_counter() - start
+    export_mb = os.path.getsize(export_path) / (1024 * 1024)
+
+    with open(hris_path, "rb") as hris_file, open(export_path, "rb") as export_file:
+        with measure(stages, "combine_data") as counts:
+            employee_data, bot_ids = combine_data(hris_file, export_file)
+            counts["users"] = len(employee_data)
+
+        with measure(stages, "extract_zip_files") as counts:
+            output = extract_zip_files(export_file, employee_data, bot_ids, workers=workers)
+            message_count = output["messages"].message_count
+            counts["messages"] = message_count
+            counts["mb"] = export_mb
+
+        with measure(stages, "build_output_zip") as counts, tempfile.TemporaryFile() as output_file:
+            write_message_archive(output, output_file)
+            counts["messages"] = message_count
+        del output
+
+        with measure(stages, "stream_anonymized_export") as counts, tempfile.TemporaryFile() as output_file:
+            summary = stream_anonymized_export(export_file, employee_data, bot_ids, output_file, workers=workers)
+            counts["messages"] = summary["message_count"]
+            counts["day_files"] = summary["day_file_count"]
+            counts["mb"] = export_mb
+
+    csv_stage = _benchmark_anonymize_dataframe(stages, notes_path, workers, model)
+
+    return {
+        "version": BENCHMARK_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "scale": {
+            **written,
+            "export_mb": export_mb,
+            "csv_rows": csv_rows,
+            "workers": workers,
+            "model": model,
+            "seed": seed,
+        },
+        "generate_seconds": generate_seconds,
+        "stages": stages,
+        "skipped": csv_stage,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _benchmark_anonymize_dataframe(stages, notes_path, workers, model):
+    """Time processors.anonymize_dataframe; returns {stage: reason} if it cannot run here."""
+    import pandas as pd
+
+    try:
+        from presidio_setup import get_presidio_engines, DEFAULT_OPERATORS
+        from processors import anonymize_dataframe
+
+        model_size = None if model == "none" else model
+        analyzer, anonymizer = get_presidio_engines(model_size)
+    except (ImportError, OSError) as e:
+        # Presidio or the spaCy model is not installed
+        return {"anonymize_dataframe": f"{type(e).__name__}: {e}"}
+
+    df = pd.read_csv(notes_path, dtype=object, keep_default_na=False)
+    columns = ["email", "phone", "note"]
+    with measure(stages, "anonymize_dataframe") as counts:
+        anonymize_dataframe(
+            df, analyzer, anonymizer, DEFAULT_OPERATORS, columns,
+            workers=workers, engine_factory=_ENGINE_FACTORIES[model],
+        )
+        counts["rows"] = len(df)
+    return {}
+
+
+# Picklable factories for worker processes, per --model
+_ENGINE_FACTORIES = {
+    model: partial(create_presidio_engines, None if model == "none" else model)
+    for model in ("none", "sm", "md", "lg")
+}
+
+
+def compare_results(baseline, current, tolerance=DEFAULT_TOLERANCE):
+    """
+    Return (lines, regressions): a per-stage comparison of wall time and
+    peak memory, and the names of stages slower than baseline by more than
+    tolerance.
+    """
+    lines = []
+    regressions = []
+    if baseline.get("scale") != current.get("scale"):
+        lines.append("Warning: baseline was recorded at a different scale; times are not directly comparable.")
+
+    for name, stage in current["stages"].items():
+        previous = baseline.get("stages", {}).get(name)
+        if previous is None:
+            lines.append(f"{name:<26} {stage['seconds']:8.2f} s   (not in baseline)")
+            continue
+        ratio = stage["seconds"] / previous["seconds"] if previous["seconds"] else float("inf")
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        lines.append(
+            f"{name:<26} {stage['seconds']:8.2f} s vs {previous['seconds']:8.2f} s ({ratio:5.2f}x), "
+            f"peak {stage['peak_rss_mb']:7.1f} MB vs {previous['peak_rss_mb']:7.1f} MB{flag}"
+        )
+    return lines, regressions
+
+
+def format_results(results):
+    lines = [f"Scale: {results['scale']}"]
+    for name, stage in results["stages"].items():
+        rates = ", ".join(
+            f"{value:,.1f} {key[:-len('_per_second')]}/s" for key, value in stage.items() if key.endswith("_per_second")
+        )
+        lines.append(f"{name:<26} {stage['seconds']:8.2f} s  peak {stage['peak_rss_mb']:7.1f} MB  {rates}")
+    for name, reason in results["skipped"].items():
+        lines.append(f"{name:<26} skipped ({reason})")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the anonymization pipelines on synthetic data.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--csv-rows", type=int, default=20_000, help="Rows of the synthetic CSV for anonymize_dataframe")
+    parser.add_argument("-w", "--workers", type=int, default=1)
+    parser.add_argument(
+        "--model",
+        choices=["none", "sm", "md", "lg"],
+        default="none",
+        help="spaCy model for anonymize_dataframe; 'none' uses pattern recognizers only",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="Where to generate data (default: a temporary directory)")
+    parser.add_argument("-o", "--output", help="Write the results as JSON (e.g. a new baseline)")
+    parser.add_argument("--compare", metavar="BASELINE.json", help="Compare with an earlier run")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown before failing")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = args.work_dir or temp_dir
+        os.makedirs(work_dir, exist_ok=True)
+        results = run_benchmark(
+            work_dir,
+            users=args.users,
+            channels=args.channels,
+            messages=args.messages,
+            csv_rows=args.csv_rows,
+            workers=args.workers,
+            model=args.model,
+            seed=args.seed,
+        )
+
+    print(format_results(results))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines, regressions = compare_results(baseline, results, tolerance=args.tolerance)
+        print("\n".join(lines))
+        if regressions:
+            print(f"Slower than baseline: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
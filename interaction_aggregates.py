@@ -0,0 +1,104 @@
+"""
+Interaction aggregates counted while the messages are anonymized, so network
+analysis can load a few small tables instead of re-reading every day file.
+
+    reply_edges       source replied to a thread started by target, count times
+    reaction_edges    source reacted to a message by target, count times
+    daily_messages    messages per user per day
+    thread_sizes      replies and distinct repliers per thread
+
+Users are anonymized Clarity_IDs and nothing else is added: no message
+content, reaction names or original IDs.
+"""
+from collections import Counter
+
+AGGREGATES_DIR = "aggregates"
+
+# Table name -> columns, in order
+AGGREGATE_TABLES = {
+    "reply_edges": ("source", "target", "count"),
+    "reaction_edges": ("source", "target", "count"),
+    "daily_messages": ("user", "date", "messages"),
+    "thread_sizes": ("conversation_id", "thread_ts", "user", "replies", "repliers"),
+}
+
+
+class InteractionAggregates:
+    """
+    Sparse interaction counts over anonymized day files. Users are interned
+    to indexes, so each edge is a Counter entry of two small ints.
+    """
+
+    def __init__(self):
+        self._user_names = []
+        self._user_index = {}
+        self._replies = Counter()    # (replier, thread author) -> replies
+        self._reactions = Counter()  # (reactor, message author) -> reactions
+        self._daily = Counter()      # (user, date) -> messages
+        self._threads = []           # (conv_id, thread_ts, author, replies, repliers)
+
+    def _user(self, clarity_id):
+        index = self._user_index.get(clarity_id)
+        if index is None:
+            index = self._user_index[clarity_id] = len(self._user_names)
+            self._user_names.append(clarity_id)
+        return index
+
+    def add_day(self, conv_id, date, msgs):
+        """Count the anonymized messages of one day file."""
+        user = self._user
+        replies_counter = self._replies
+        reactions_counter = self._reactions
+        daily = self._daily
+
+        for msg in msgs:
+            author = user(msg["user"])
+            daily[author, date] += 1
+
+            # Older exports list every reply; newer ones only the distinct repliers
+            replies = msg.get("replies")
+            if replies:
+                for reply in replies:
+                    replies_counter[user(reply["user"]), author] += 1
+            else:
+                for replier in msg.get("reply_users") or ():
+                    replies_counter[user(replier), author] += 1
+
+            for reaction in msg.get("reactions") or ():
+                for reactor in reaction["users"]:
+                    reactions_counter[user(reactor), author] += 1
+
+            reply_count = msg.get("reply_count")
+            if reply_count or replies:
+                self._threads.append((
+                    conv_id,
+                    msg.get("thread_ts", msg["ts"]),
+                    author,
+                    reply_count if reply_count else len(replies),
+                    msg.get("reply_users_count")
+                    or len({reply["user"] for reply in replies or ()} or set(msg.get("reply_users") or ())),
+                ))
+
+    def tables(self):
+        """{table name: rows} for AGGREGATE_TABLES, rows as dicts in a stable order."""
+        names = self._user_names
+        return {
+            "reply_edges": _edge_rows(self._replies, names),
+            "reaction_edges": _edge_rows(self._reactions, names),
+            "daily_messages": [
+                {"user": names[user], "date": date, "messages": count}
+                for (user, date), count in sorted(self._daily.items(), key=lambda item: (names[item[0][0]], item[0][1]))
+            ],
+            "thread_sizes": [
+                {"conversation_id": conv_id, "thread_ts": thread_ts, "user": names[author], "replies": replies,
+                 "repliers": repliers}
+                for conv_id, thread_ts, author, replies, repliers in self._threads
+            ],
+        }
+
+
+def _edge_rows(edges, names):
+    return [
+        {"source": names[source], "target": names[target], "count": count}
+        for (source, target), count in sorted(edges.items(), key=lambda item: (names[item[0][0]], names[item[0][1]]))
+    ]
@@ -0,0 +1,457 @@
+"""
+Local job service: queue Slack exports by file path and anonymize them with a
+bounded pool of worker processes.
+
+    python job_queue.py submit HRIS.csv slack_export.zip -o anonymized.zip
+    python job_queue.py run --jobs 2 --memory-limit-mb 4096
+    python job_queue.py status
+
+Jobs live in a SQLite file, so they can be submitted while the service runs
+and their status and statistics are kept after it stops. Each job runs
+batch.run_batch in its own process, optionally with a memory limit, so one
+large export that fails or runs out of memory does not affect the others.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import sys
+import time
+
+from archive_writer import COMPRESSION_METHODS, DEFAULT_COMPRESSION
+from table_output import DEFAULT_OUTPUT_FORMAT, available_output_formats, check_output_format
+
+DEFAULT_DB_PATH = "pii_sanitizer_jobs.sqlite3"
+
+# Exports anonymized at the same time by the service
+DEFAULT_CONCURRENT_JOBS = 2
+
+# How often the service checks for new, finished and cancelled jobs
+POLL_SECONDS = 1.0
+
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+
+# Keyword arguments of batch.run_batch a job may set
+JOB_OPTIONS = (
+    "workers", "compact", "compression", "compression_level", "compress_threads",
+    "k_combinations", "previous_path", "output_format", "aggregates",
+)
+
+_JOB_COLUMNS = (
+    "id", "status", "hris", "export", "output", "options", "submitted", "started", "finished",
+    "service_pid", "pid", "cancel_requested", "stats", "warnings", "error",
+)
+
+
+class JobStore:
+    """
+    Jobs in a SQLite file at path. Every method runs in its own transaction,
+    so the service, its job processes and submit/status commands can share
+    the file.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        # Autocommit; claim_next opens its own write transaction
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, status TEXT NOT NULL, "
+            "hris TEXT NOT NULL, export TEXT NOT NULL, output TEXT NOT NULL, options TEXT NOT NULL, "
+            "submitted REAL NOT NULL, started REAL, finished REAL, service_pid INTEGER, pid INTEGER, "
+            "cancel_requested INTEGER NOT NULL DEFAULT 0, stats TEXT, warnings TEXT, error TEXT)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "service_pid" not in columns:
+            # Stores created before jobs recorded the service that claimed them
+            self._db.execute("ALTER TABLE jobs ADD COLUMN service_pid INTEGER")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def submit(self, hris_path, export_path, output_path, **options):
+        """Queue a job and return its ID. Paths are stored as absolute paths."""
+        unknown = set(options) - set(JOB_OPTIONS)
+        if unknown:
+            raise ValueError(f"Unknown job options: {', '.join(sorted(unknown))}")
+        check_output_format(options.get("output_format", DEFAULT_OUTPUT_FORMAT))
+        for path in (hris_path, export_path):
+            if not os.path.isfile(path):
+                raise ValueError(f"File not found: {path}")
+
+        output_path = os.path.abspath(output_path)
+        if self._db.execute(
+            "SELECT 1 FROM jobs WHERE output = ? AND status IN ('queued', 'running')", (output_path,)
+        ).fetchone():
+            raise ValueError(f"A queued or running job already writes {output_path}")
+        if options.get("previous_path") is not None:
+            options["previous_path"] = os.path.abspath(options["previous_path"])
+
+        cursor = self._db.execute(
+            "INSERT INTO jobs (status, hris, export, output, options, submitted) VALUES ('queued', ?, ?, ?, ?, ?)",
+            (os.path.abspath(hris_path), os.path.abspath(export_path), output_path, json.dumps(options), time.time()),
+        )
+        return cursor.lastrowid
+
+    def get(self, job_id):
+        """The job as a dict, or None."""
+        row = self._db.execute(f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_dict(row) if row else None
+
+    def jobs(self, status=None):
+        """All jobs, oldest first, optionally only those with the given status."""
+        query = f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs"
+        if status is None:
+            rows = self._db.execute(query + " ORDER BY id").fetchall()
+        else:
+            rows = self._db.execute(query + " WHERE status = ? ORDER BY id", (status,)).fetchall()
+        return [_job_dict(row) for row in rows]
+
+    def claim_next(self):
+        """
+        Mark the oldest queued job as running, owned by this process, and
+        return it, or None.
+        """
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is not None:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'running', started = ?, service_pid = ?, pid = NULL WHERE id = ?",
+                    (time.time(), os.getpid(), row[0]),
+                )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return self.get(row[0]) if row else None
+
+    def set_pid(self, job_id, pid):
+        self._db.execute("UPDATE jobs SET pid = ? WHERE id = ? AND status = 'running'", (pid, job_id))
+
+    def finish(self, job_id, status, stats=None, warnings=None, error=None):
+        """Record the outcome of a running job; a job that already finished is left as it is."""
+        self._db.execute(
+            "UPDATE jobs SET status = ?, finished = ?, stats = ?, warnings = ?, error = ? "
+            "WHERE id = ? AND status = 'running'",
+            (
+                status,
+                time.time(),
+                None if stats is None else json.dumps(stats),
+                json.dumps(warnings) if warnings else None,
+                error,
+                job_id,
+            ),
+        )
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. A queued job is cancelled at once; a running job is
+        stopped by the service at its next check. Returns the job's status.
+        """
+        self._db.execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+                         (time.time(), job_id))
+        self._db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        job = self.get(job_id)
+        if job is None:
+            raise ValueError(f"No job with ID {job_id}")
+        return job["status"]
+
+    def cancel_requested(self):
+        """IDs of running jobs that should be stopped."""
+        return [row[0] for row in self._db.execute(
+            "SELECT id FROM jobs WHERE status = 'running' AND cancel_requested = 1"
+        ).fetchall()]
+
+    def recover(self):
+        """
+        Queue again the running jobs whose service and job process are both
+        gone, e.g. after the service was killed. A job another service has
+        claimed but not started yet has no job process, but its service is
+        alive. Returns their IDs.
+        """
+        stale = [
+            job_id
+            for job_id, service_pid, pid in self._db.execute(
+                "SELECT id, service_pid, pid FROM jobs WHERE status = 'running'"
+            ).fetchall()
+            if not (service_pid is not None and _process_alive(service_pid))
+            and not (pid is not None and _process_alive(pid))
+        ]
+        for job_id in stale:
+            self.requeue(job_id)
+        return stale
+
+    def requeue(self, job_id):
+        self._db.execute(
+            "UPDATE jobs SET status = 'queued', started = NULL, service_pid = NULL, pid = NULL "
+            "WHERE id = ? AND status = 'running'",
+            (job_id,),
+        )
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _job_dict(row):
+    job = dict(zip(_JOB_COLUMNS, row))
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    for column in ("options", "stats", "warnings"):
+        if job[column] is not None:
+            job[column] = json.loads(job[column])
+    return job
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to another user
+        return True
+    return True
+
+
+def limit_memory(memory_limit_mb):
+    """
+    Cap the memory this process (and the workers it starts) may allocate.
+    Returns False where the limit cannot be set (e.g. Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return False
+
+    # RLIMIT_DATA counts heap allocations but not the memory-mapped input export
+    limit = int(memory_limit_mb * 1024 * 1024)
+    try:
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+    except (ValueError, OSError):
+        return False
+    return True
+
+
+def execute_job(db_path, job, memory_limit_mb=None):
+    """Run one claimed job in this process and record its outcome in the store."""
+    from batch import run_batch
+
+    if hasattr(os, "setpgrp"):
+        # Own process group, so stop_job also reaches the message workers run_batch starts
+        os.setpgrp()
+
+    warnings = []
+    if memory_limit_mb and not limit_memory(memory_limit_mb):
+        warnings.append("The memory limit is not supported on this platform and was not applied.")
+
+    try:
+        options = dict(job["options"])
+        if options.get("k_combinations") is not None:
+            options["k_combinations"] = [tuple(columns) for columns in options["k_combinations"]]
+        stats = run_batch(job["hris"], job["export"], job["output"], warn=warnings.append, **options)
+        outcome = {"status": "done", "stats": stats}
+    except MemoryError:
+        outcome = {"status": "failed", "error": f"Out of memory (limit: {memory_limit_mb} MB)"}
+    except Exception as e:
+        outcome = {"status": "failed", "error": str(e) if isinstance(e, ValueError) else f"{type(e).__name__}: {e}"}
+
+    with JobStore(db_path) as store:
+        store.finish(job["id"], warnings=warnings, **outcome)
+
+
+def stop_job(process):
+    """Terminate a job process, and the worker processes it started even if it already exited."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (AttributeError, OSError):
+        # Windows, or the job has not made its own process group yet
+        process.terminate()
+    process.join()
+
+
+def _remove_partial(job):
+    # run_batch writes next to the output; a stopped job leaves its partial file behind
+    try:
+        os.remove(job["output"] + ".partial")
+    except OSError:
+        pass
+
+
+def run_service(
+    db_path=DEFAULT_DB_PATH,
+    concurrent_jobs=DEFAULT_CONCURRENT_JOBS,
+    memory_limit_mb=None,
+    drain=False,
+    poll_seconds=POLL_SECONDS,
+    log=None,
+):
+    """
+    Run queued jobs, at most concurrent_jobs at a time, each in its own
+    process. With drain, return once the queue is empty; otherwise keep
+    waiting for new jobs until interrupted.
+    """
+    if concurrent_jobs < 1:
+        raise ValueError("At least one concurrent job is needed.")
+    log = log or (lambda message: None)
+
+    running = {}  # job ID -> (job, process)
+    with JobStore(db_path) as store:
+        for job_id in store.recover():
+            log(f"Job {job_id} was interrupted and is queued again")
+
+        try:
+            while True:
+                for job_id, (job, process) in list(running.items()):
+                    if process.is_alive():
+                        continue
+                    process.join()
+                    del running[job_id]
+                    if process.exitcode != 0:
+                        # Killed (e.g. by the OOM killer) before it could record anything
+                        # Its message workers may have outlived it
+                        stop_job(process)
+                        store.finish(job_id, "failed", error=f"Job process exited with code {process.exitcode}")
+                        _remove_partial(job)
+                    log(f"Job {job_id} {store.get(job_id)['status']}")
+
+                for job_id in store.cancel_requested():
+                    if job_id not in running:
+                        # Run by another service
+                        continue
+                    job, process = running.pop(job_id)
+                    stop_job(process)
+                    _remove_partial(job)
+                    store.finish(job_id, "cancelled")
+                    log(f"Job {job_id} cancelled")
+
+                while len(running) < concurrent_jobs:
+                    job = store.claim_next()
+                    if job is None:
+                        break
+                    process = multiprocessing.Process(
+                        target=execute_job, args=(db_path, job, memory_limit_mb), name=f"job-{job['id']}"
+                    )
+                    process.start()
+                    store.set_pid(job["id"], process.pid)
+                    running[job["id"]] = (job, process)
+                    log(f"Job {job['id']} started: {job['export']}")
+
+                if drain and not running:
+                    return
+                time.sleep(poll_seconds)
+        finally:
+            # Interrupted: stop the jobs in progress and queue them for the next run
+            for job_id, (job, process) in running.items():
+                stop_job(process)
+                _remove_partial(job)
+                store.requeue(job_id)
+
+
+def format_job(job):
+    line = f"{job['id']:>5}  {job['status']:<9}  {job['export']} -> {job['output']}"
+    if job["started"] is not None:
+        seconds = (job["finished"] or time.time()) - job["started"]
+        line += f"  ({seconds:.1f} s)"
+    if job["error"]:
+        line += f"\n       Error: {job['error']}"
+    for warning in job["warnings"] or []:
+        line += f"\n       Warning: {warning.strip()}"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Queue Slack exports and anonymize them with a pool of workers.")
+    parser.add_argument(
+        "--db",
+        default=os.environ.get("PII_SANITIZER_JOB_DB", DEFAULT_DB_PATH),
+        help="SQLite job store (default: $PII_SANITIZER_JOB_DB or ./pii_sanitizer_jobs.sqlite3)",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="Queue an export")
+    submit.add_argument("hris", help="HRIS CSV file with an email column")
+    submit.add_argument("export", help="Original Slack workspace export ZIP")
+    submit.add_argument("-o", "--output", required=True, help="Anonymized archive to write")
+    submit.add_argument("-w", "--workers", type=int, default=1, help="Processes used to anonymize messages")
+    submit.add_argument("--compact", action="store_true", help="Write JSON without indentation")
+    submit.add_argument("--format", choices=available_output_formats(), default=DEFAULT_OUTPUT_FORMAT)
+    submit.add_argument("--aggregates", action="store_true", help="Also write the interaction aggregates")
+    submit.add_argument("--compression", choices=list(COMPRESSION_METHODS), default=DEFAULT_COMPRESSION)
+    submit.add_argument("--level", type=int, choices=range(10), metavar="0-9", help="DEFLATE level or LZMA preset")
+    submit.add_argument("--previous", metavar="PREVIOUS.zip", help="Earlier anonymized archive to reuse day files from")
+
+    run = commands.add_parser("run", help="Run queued jobs")
+    run.add_argument("-j", "--jobs", type=int, default=DEFAULT_CONCURRENT_JOBS, help="Exports anonymized at a time")
+    run.add_argument("--memory-limit-mb", type=int, help="Memory each job process may allocate")
+    run.add_argument("--drain", action="store_true", help="Stop once the queue is empty instead of waiting")
+
+    status = commands.add_parser("status", help="Show jobs")
+    status.add_argument("job_id", type=int, nargs="?", help="Show one job with its statistics")
+    status.add_argument("--state", choices=JOB_STATES, help="Only jobs in this state")
+
+    cancel = commands.add_parser("cancel", help="Cancel a queued or running job")
+    cancel.add_argument("job_id", type=int)
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "run":
+            run_service(
+                args.db,
+                concurrent_jobs=args.jobs,
+                memory_limit_mb=args.memory_limit_mb,
+                drain=args.drain,
+                log=print,
+            )
+            return 0
+
+        with JobStore(args.db) as store:
+            if args.command == "submit":
+                job_id = store.submit(
+                    args.hris,
+                    args.export,
+                    args.output,
+                    workers=args.workers,
+                    compact=args.compact,
+                    output_format=args.format,
+                    compression=args.compression,
+                    compression_level=args.level,
+                    previous_path=args.previous,
+                    aggregates=args.aggregates,
+                )
+                print(f"Job {job_id} queued")
+            elif args.command == "cancel":
+                status = store.cancel(args.job_id)
+                if status == "running":
+                    print(f"Job {args.job_id} will be stopped by the service")
+                else:
+                    print(f"Job {args.job_id} {status}")
+            elif args.job_id is not None:
+                job = store.get(args.job_id)
+                if job is None:
+                    raise ValueError(f"No job with ID {args.job_id}")
+                print(format_job(job))
+                if job["stats"]:
+                    from batch import format_stats
+
+                    print(format_stats(job["stats"]))
+            else:
+                for job in store.jobs(args.state):
+                    print(format_job(job))
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# HRIS columns that could single out an employee and are generalized before export
+QUASI_IDENTIFIER_COLUMNS = ["Role", "Team", "Work_Location", "Employment_Status", "Employment_Type", "Tenure_Band"]
+
+SUPPRESSED_VALUE = "Others"
+
+TENURE_BAND_EDGES = [90, 180, 365, 730, 1825]  # days
+TENURE_BAND_LABELS = ["0-3mo", "3-6mo", "6-12mo", "1-2yr", "2-5yr", "5+yr"]
+UNKNOWN_TENURE = "Unknown"
+
+
+def calculate_tenure_band(hire_date):
+    if pd.isna(hire_date):
+        return UNKNOWN_TENURE
+    try:
+        tenure_days = (datetime.now() - pd.to_datetime(hire_date)).days
+    except:
+        return UNKNOWN_TENURE
+    if pd.isna(tenure_days):
+        return UNKNOWN_TENURE
+    return TENURE_BAND_LABELS[int(np.searchsorted(TENURE_BAND_EDGES, tenure_days, side="right"))]
+
+
+def calculate_tenure_bands(hire_dates):
+    """Tenure_Band for a whole Date_of_Hire column at once."""
+    try:
+        # format="mixed" parses every value on its own, like the per-value calculate_tenure_band
+        hire_dt = pd.to_datetime(hire_dates, format="mixed", errors="coerce")
+        tenure_days = (pd.Timestamp(datetime.now()) - hire_dt).dt.days
+    except Exception:
+        # e.g. mixed timezone-aware and naive dates; fall back to one value at a time
+        return hire_dates.apply(calculate_tenure_band)
+
+    bands = pd.cut(
+        tenure_days,
+        bins=[-np.inf, *TENURE_BAND_EDGES, np.inf],
+        labels=TENURE_BAND_LABELS,
+        right=False,
+    )
+    return bands.astype(object).where(bands.notna(), UNKNOWN_TENURE)
+
+
+def _suppress_rare_values(values, k):
+    """
+    Replace missing/empty values and values occurring fewer than k times with
+    "Others". If "Others" itself ends up with fewer than k rows, the whole
+    column is suppressed.
+    """
+    values = values.astype(object)
+    values = values.where(values.notna() & (values != ""), SUPPRESSED_VALUE)
+
+    codes, _ = pd.factorize(values)
+    counts = np.bincount(codes)
+    values = values.where(counts[codes] >= k, SUPPRESSED_VALUE)
+
+    others_count = int((values == SUPPRESSED_VALUE).sum())
+    if 0 < others_count < k:
+        values = pd.Series(SUPPRESSED_VALUE, index=values.index, dtype=object)
+    return values
+
+
+def _suppress_rare_combinations(df, columns, k):
+    """Suppress every column of the combination for rows whose combination occurs fewer than k times."""
+    group_sizes = df.groupby(columns, sort=False, dropna=False)[columns[0]].transform("size")
+    rare = group_sizes < k
+    if not rare.any():
+        return
+
+    df.loc[rare, columns] = SUPPRESSED_VALUE
+    all_suppressed = (df[columns] == SUPPRESSED_VALUE).all(axis=1)
+    if all_suppressed.sum() < k:
+        df[columns] = SUPPRESSED_VALUE
+
+
+def enforce_k_anonymity(df, columns=QUASI_IDENTIFIER_COLUMNS, k=5, combinations=None):
+    """
+    Apply k-anonymity to each available column in one pass over a single copy
+    of df. combinations optionally lists column groups (e.g. [("Team", "Role")])
+    whose joint values must also occur at least k times.
+    """
+    df = df.copy()
+    for column in columns:
+        if column in df.columns:
+            df[column] = _suppress_rare_values(df[column], k)
+
+    for combination in combinations or []:
+        combination = [column for column in combination if column in df.columns]
+        if len(combination) > 1:
+            _suppress_rare_combinations(df, combination, k)
+
+    return df
+
+
+def apply_k_anonymity(df, column, k=5):
+    return enforce_k_anonymity(df, [column], k=k)
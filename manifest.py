@@ -0,0 +1,86 @@
+"""
+Manifest of the day files behind an anonymized archive, used to re-anonymize
+cumulative exports incrementally.
+
+Each entry is keyed by "<conversation id>/<date>" and records the CRC and
+size of the source day file from the export's central directory, the
+number of messages kept, and whether the day file mentions users that had
+no Clarity_ID. The manifest holds no names, raw Slack IDs or message
+content.
+It stays next to the output archive and is never added to it.
+"""
+import hashlib
+import json
+import os
+import time
+
+# Bump when the day file transform changes, so older manifests are not reused
+MANIFEST_VERSION = 2
+
+
+def manifest_path(output_path):
+    return output_path + ".manifest.json"
+
+
+def _digest(payload):
+    return hashlib.sha256(json.dumps(payload, separators=(',', ':'), default=str).encode()).hexdigest()
+
+
+def new_manifest(context, compact=False, output_format="json"):
+    """
+    Empty manifest for a run. Besides the source file, a day file's output
+    depends on the output format, the local timezone used for timestamp
+    coarsening, the bot list and the mapped users, so those are recorded too.
+    """
+    settings = {"compact": compact, "timezone": [time.timezone, time.altzone, list(time.tzname)]}
+    if output_format != "json":
+        # Only added for table formats, so manifests of earlier JSON runs stay valid
+        settings["format"] = output_format
+    return {
+        "version": MANIFEST_VERSION,
+        "settings": _digest(settings),
+        "bots": _digest(sorted(context.bot_ids)),
+        # Already-anonymized Clarity_IDs, the same ones listed in users.json
+        "mapped": sorted(set(context.clarity_ids.values())),
+        "entries": {},
+    }
+
+
+def reusable_entries(previous_manifest, manifest):
+    """
+    Entries of previous_manifest that are still valid for manifest, else an
+    empty dict. Clarity_IDs are stable hashes, so newly mapped users only
+    invalidate the day files that left out some unmapped user last time:
+    that user may be the one now mapped, e.g. a shared-channel user added
+    to the HRIS file. Users that are no longer mapped, a different bot list
+    or different settings invalidate everything.
+    """
+    if not previous_manifest or previous_manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    if previous_manifest.get("settings") != manifest["settings"] or previous_manifest.get("bots") != manifest["bots"]:
+        return {}
+    previous_mapped, mapped = set(previous_manifest.get("mapped", [])), set(manifest["mapped"])
+    if not previous_mapped <= mapped:
+        return {}
+    entries = previous_manifest.get("entries", {})
+    if previous_mapped == mapped:
+        return entries
+    return {key: entry for key, entry in entries.items() if not entry.get("unmapped", True)}
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # A damaged manifest only costs a full run
+        return None
+
+
+def save_manifest(manifest, path):
+    partial_path = path + ".partial"
+    with open(partial_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    os.replace(partial_path, path)
@@ -0,0 +1,33 @@
+"""
+Resident memory of the current process, for run statistics and benchmarks.
+Standard library only, so any module can use it without importing the
+pipeline.
+"""
+import os
+import sys
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its finished workers, in MB."""
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb():
+    """Current resident set size of this process in MB, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        # Not Linux; the peak is the closest available figure
+        return peak_rss_mb()
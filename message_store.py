@@ -0,0 +1,35 @@
+"""
+In-memory store for the anonymized messages of extract_zip_files.
+
+A message dict with string keys and string timestamps costs several hundred
+bytes of object overhead. MessageStore keeps each day file as compact JSON
+bytes instead, and only rebuilds the message dicts while a day file is read
+back, e.g. to serialize it. Every read returns new dicts, so callers may
+modify them without changing the store.
+"""
+import json
+
+
+class MessageStore:
+    """Anonymized messages grouped by conversation and date, read back in the order they were added."""
+
+    def __init__(self):
+        self._days = {}  # conv_id -> {date: [JSON arrays of messages]}
+        self.message_count = 0
+
+    def __len__(self):
+        return self.message_count
+
+    def append_day(self, conv_id, date, messages):
+        """Add the anonymized messages of one day file of conversation conv_id."""
+        if not messages:
+            return
+        data = json.dumps(messages, ensure_ascii=False, separators=(',', ':')).encode()
+        self._days.setdefault(conv_id, {}).setdefault(date, []).append(data)
+        self.message_count += len(messages)
+
+    def iter_days(self):
+        """Yield (conv_id, date, messages) for every day file, materializing one at a time."""
+        for conv_id, dates in self._days.items():
+            for date, parts in dates.items():
+                yield conv_id, date, [msg for data in parts for msg in json.loads(data)]
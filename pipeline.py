@@ -0,0 +1,1170 @@
+import codecs
+import io
+import json
+import csv
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from zipfile import ZipFile
+
+import pandas as pd
+
+from archive_writer import DEFAULT_COMPRESSION, ArchiveWriter
+from interaction_aggregates import AGGREGATE_TABLES, AGGREGATES_DIR, InteractionAggregates
+from k_anonymity import QUASI_IDENTIFIER_COLUMNS, calculate_tenure_bands, enforce_k_anonymity
+from manifest import new_manifest, reusable_entries
+from message_store import MessageStore
+from processing_report import REPORT_NAME, ProcessingReport
+from table_output import DEFAULT_OUTPUT_FORMAT, TableWriter, check_output_format
+from timestamps import TimestampCoarsener
+
+try:
+    import orjson
+except ImportError:
+    # Optional faster JSON decoder; the standard library is used without it
+    orjson = None
+
+JSON_READ_ERROR = "Unable to read JSON file from Slack export. File may be corrupted or in an unexpected format."
+
+
+def safe_json_read(zip_obj, file_path):
+    return decode_json_bytes(zip_obj.open(file_path).read())
+
+
+def decode_json_bytes(content):
+    """
+    Parse a JSON document straight from bytes. The encoding is settled once:
+    UTF-8 (with or without BOM) is parsed directly, and only content that is
+    not valid UTF-8 is re-read as latin-1.
+    """
+    if isinstance(content, str):
+        try:
+            return json.loads(content)
+        except Exception:
+            raise ValueError(JSON_READ_ERROR) from None
+
+    if content.startswith(codecs.BOM_UTF8):
+        content = content[len(codecs.BOM_UTF8):]
+
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # orjson rejects some JSON the standard library reads (NaN, integers above 64 bits)
+            pass
+
+    try:
+        return json.loads(content)
+    except Exception:
+        pass
+
+    try:
+        content.decode('utf-8')
+    except UnicodeDecodeError:
+        # latin-1 maps every byte, so legacy exports always decode; only the JSON itself can fail
+        try:
+            return json.loads(content.decode('latin-1'))
+        except Exception:
+            pass
+
+    # Sanitized error - don't expose file paths
+    raise ValueError(JSON_READ_ERROR)
+
+
+def dumps_json(data, compact=False):
+    """
+    Serialize output files. Always uses the standard library so archives are
+    byte-identical whether or not a fast codec is installed.
+    """
+    if compact:
+        return json.dumps(data, separators=(',', ':'))
+    return json.dumps(data, indent=2)
+
+
+WORKSPACE_METADATA_FILES = ("users.json", "channels.json", "groups.json", "dms.json", "mpims.json")
+
+
+def build_archive_index(file_list):
+    """
+    Scan the archive listing once, locating the workspace metadata files and
+    grouping day files by the conversation folder they belong to.
+    """
+    metadata = {}
+    conversations = {}  # {folder_path: [(date, member_path)]}
+
+    for path in file_list:
+        if '__MACOSX' in path or not path.endswith(".json"):
+            continue
+
+        folder, _, filename = path.rpartition("/")
+        if filename in WORKSPACE_METADATA_FILES:
+            metadata.setdefault(filename, path)
+        elif folder:
+            conversations.setdefault(folder, []).append((filename[:-len(".json")], path))
+
+    return {"metadata": metadata, "conversations": conversations}
+
+
+# Chunk size used when spooling an in-memory upload to disk
+SPOOL_CHUNK_BYTES = 16 * 1024 * 1024
+
+_REQUIRED = object()
+
+
+class InputArchive:
+    """
+    A Slack export opened once and shared by every stage of a run.
+
+    The export is memory-mapped, so members are read through the page cache
+    instead of being copied into the Python heap. Uploads that are not files
+    on disk (such as Streamlit's UploadedFile) are spooled to a temporary
+    file first. The central directory is parsed and indexed once, and the
+    workspace metadata files are parsed on first use and then shared.
+    """
+
+    def __init__(self, source, report=None):
+        report = report if report is not None else ProcessingReport()
+        self._files = []
+        self._mapping = None
+        self._metadata = {}
+        self._lock = threading.Lock()
+
+        start = time.perf_counter()
+        try:
+            self._mapping = self._map(source)
+            # An empty file cannot be mapped; ZipFile reports it as a bad archive
+            self.zip = ZipFile(_MappedFile(self._mapping) if self._mapping is not None else io.BytesIO(), 'r')
+        except BaseException:
+            self.close()
+            raise
+        self.index = build_archive_index(self.zip.namelist())
+        # Kept so runs sharing an archive opened earlier can report it too
+        self.open_seconds = time.perf_counter() - start
+        report.add_time("zip_open_index", self.open_seconds)
+
+    def _map(self, source):
+        if isinstance(source, (str, os.PathLike)):
+            f = open(source, 'rb')
+            self._files.append(f)
+            return _map_file(f)
+
+        try:
+            # Already a file on disk: map it in place
+            return _map_file(source)
+        except (AttributeError, OSError, ValueError):
+            pass
+
+        spool = tempfile.TemporaryFile()
+        self._files.append(spool)
+        source.seek(0)
+        shutil.copyfileobj(source, spool, SPOOL_CHUNK_BYTES)
+        spool.flush()
+        return _map_file(spool)
+
+    def metadata(self, filename, default=_REQUIRED):
+        """
+        Parsed JSON of a workspace metadata file such as "users.json". Returns
+        default when the export has no such file, or raises ValueError when no
+        default is given. Callers share the parsed object and must not modify it.
+        """
+        path = self.index["metadata"].get(filename)
+        if path is None:
+            if default is _REQUIRED:
+                raise ValueError(JSON_READ_ERROR)
+            return default
+
+        with self._lock:
+            if filename not in self._metadata:
+                self._metadata[filename] = safe_json_read(self.zip, path)
+            return self._metadata[filename]
+
+    def close(self):
+        zipf = getattr(self, "zip", None)
+        if zipf is not None:
+            zipf.close()
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+        for f in self._files:
+            f.close()
+        self._files = []
+        self._metadata = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class _MappedFile(io.RawIOBase):
+    """Read-only file interface over an mmap (mmap itself has no seekable() before Python 3.13)."""
+
+    def __init__(self, mapping):
+        super().__init__()
+        self._mapping = mapping
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        try:
+            self._mapping.seek(offset, whence)
+        except ValueError as e:
+            # Regular files raise OSError here, which ZipFile expects for files too short to be archives
+            raise OSError(str(e)) from None
+        return self._mapping.tell()
+
+    def tell(self):
+        return self._mapping.tell()
+
+    def read(self, size=-1):
+        return self._mapping.read(None if size is None or size < 0 else size)
+
+    def readinto(self, buffer):
+        data = self._mapping.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _map_file(f):
+    """Read-only memory map of an open file, or None for an empty file."""
+    fileno = f.fileno()
+    if os.fstat(fileno).st_size == 0:
+        return None
+    return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+
+
+@contextmanager
+def input_archive(source, report=None):
+    """Use source as an InputArchive: shared as is when it already is one, else opened for the block."""
+    if isinstance(source, InputArchive):
+        yield source
+        return
+    with InputArchive(source, report) as archive:
+        yield archive
+
+
+# Delimiters detect_delimiter chooses from; anything else falls back to ','
+CSV_DELIMITERS = ",;\t|"
+
+
+def detect_delimiter(file):
+    file.seek(0)
+    sample = file.read(4096)
+    file.seek(0)
+    if isinstance(sample, bytes):
+        sample = sample.decode('utf-8', errors='ignore')
+    try:
+        sniffer = csv.Sniffer()
+        # Unrestricted, the sniffer can pick '\r' or a letter, e.g. for CRLF files with commas in quoted fields
+        return sniffer.sniff(sample, delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        return ','
+
+
+def _hashed_id(prefix, original_id):
+    # Take first 10 chars of the SHA-256 hex digest and prepend the type prefix
+    return prefix + hashlib.sha256(original_id.encode()).hexdigest()[:10].upper()
+
+
+def generate_clarity_ids(slack_ids):
+    """Hash a column of Slack user IDs to Clarity_IDs ('E' for employee)."""
+    return pd.Series([_hashed_id("E", slack_id) for slack_id in slack_ids.tolist()], index=slack_ids.index)
+
+
+def generate_conversation_id(conv_original_id, is_dm):
+    """Generate anonymized conversation ID using SHA-256 hashing ('D' for DM, 'C' for channel)"""
+    return _hashed_id("D" if is_dm else "C", conv_original_id)
+
+
+def combine_data(uploaded_file, zip_uploaded_file, warn=None, k=5, k_combinations=None, report=None):
+    """
+    Merge the HRIS file with the Slack users and apply k-anonymity. Returns
+    (employee_data, bot_ids). zip_uploaded_file is the export, or an
+    InputArchive shared with the later stages. Stage timings and counts are
+    added to report (a ProcessingReport) when given.
+    """
+    report = report if report is not None else ProcessingReport()
+
+    with report.stage("hris_read"):
+        delimiter = detect_delimiter(uploaded_file)
+        df = pd.read_csv(uploaded_file, delimiter=delimiter)
+    report.count("hris_rows", len(df))
+
+    with input_archive(zip_uploaded_file, report) as archive, report.stage("users_parse"):
+        if "users.json" not in archive.index["metadata"]:
+            raise ValueError("Slack export is missing required user data. Please ensure you've exported a complete Slack workspace.")
+
+        slack_user_data = archive.metadata("users.json")
+        
+        # Check if this is already anonymized data
+        if slack_user_data and isinstance(slack_user_data, list) and slack_user_data[0].get('Clarity_ID'):
+            raise ValueError("This appears to be an already anonymized Slack export. Please upload the original Slack export ZIP file.")
+
+        slack_user_data = pd.DataFrame([{
+            "slack_id": u["id"],
+            "email_address": u["profile"].get("email"),
+            "timezone": u.get("tz_label"),
+            "is_bot": u["profile"].get("bot_id") is not None or u.get("is_bot", False)
+        } for u in slack_user_data if isinstance(u, dict) and u.get("id")])
+
+    report.count("slack_users", len(slack_user_data))
+    merge_started = time.perf_counter()
+    email_col = next((c for c in ["Email Address", "email", "Email", "work_email", "Email"] if c in df.columns), None)
+    
+    if not email_col:
+        raise ValueError("HRIS file must contain an email column. Accepted names: 'Email', 'Email Address', 'email', or 'work_email'")
+
+    merged = slack_user_data.merge(df, how="outer", left_on="email_address", right_on=email_col)
+
+    # Separate bots and real users
+    employee_data = merged[merged.is_bot == False].copy()
+    bot_ids = merged[merged.is_bot == True].slack_id.tolist()
+    
+    # Find users in Slack but not in HRIS (excluding bots)
+    slack_only_users = employee_data[employee_data[email_col].isna()].copy()
+    if len(slack_only_users) > 0:
+        unmapped_emails = slack_only_users['email_address'].dropna().tolist()
+        unmapped_count = len(unmapped_emails)
+        sample_emails = unmapped_emails[:5]
+        
+        error_msg = f"Found {unmapped_count} Slack user(s) that cannot be mapped to HRIS data.\n\n"
+        error_msg += "Sample unmapped emails:\n"
+        for email in sample_emails:
+            error_msg += f"  • {email}\n"
+        if unmapped_count > 5:
+            error_msg += f"  ... and {unmapped_count - 5} more\n"
+        error_msg += "\nPlease ensure all Slack users (except bots) exist in your HRIS CSV file."
+        raise ValueError(error_msg)
+    
+    # Find users in HRIS but not in Slack (warning, not error)
+    hris_only_users = employee_data[employee_data['slack_id'].isna()].copy()
+    if len(hris_only_users) > 0 and warn:
+        warn(f" {len(hris_only_users)} employee(s) in HRIS were not found in Slack export. They will be excluded from the anonymized data.")
+
+    # Keep only successfully mapped users
+    employee_data = employee_data[employee_data['slack_id'].notna() & employee_data[email_col].notna()].copy()
+    
+    if len(employee_data) == 0:
+        raise ValueError("No users could be matched between Slack export and HRIS data. Please check that emails match in both files.")
+
+    # Use one-way hashing (SHA-256) to generate Clarity_IDs - no reverse lookup possible
+    employee_data["Clarity_ID"] = generate_clarity_ids(employee_data["slack_id"])
+    report.add_time("hris_merge", time.perf_counter() - merge_started)
+    report.count("employees_mapped", len(employee_data))
+    report.count("hris_only_employees", len(hris_only_users))
+    report.count("bots", len(bot_ids))
+
+    with report.stage("k_anonymity"):
+        # Calculate Tenure_Band from Date_of_Hire if available
+        if "Date_of_Hire" in employee_data.columns:
+            employee_data["Tenure_Band"] = calculate_tenure_bands(employee_data["Date_of_Hire"])
+
+        # Apply k-anonymity to every quasi-identifier column (and optional column combinations)
+        employee_data = enforce_k_anonymity(employee_data, QUASI_IDENTIFIER_COLUMNS, k=k, combinations=k_combinations)
+
+    return employee_data, bot_ids
+
+
+NO_MESSAGES_ERROR = ("No messages were found or processed. Please ensure:\n"
+                     "  1. Your Slack export contains message files\n"
+                     "  2. Users in messages match users in your HRIS CSV\n"
+                     "  3. The export includes actual conversation data (not just user/channel lists)")
+
+
+EMPLOYEE_METADATA_COLUMNS = {
+    # output key: employee_data column
+    "Team": "Team",
+    "Role": "Role",
+    "Timezone": "timezone",
+    "Work_Location": "Work_Location",
+    "Employment_Status": "Employment_Status",
+    "Employment_Type": "Employment_Type",
+    "Tenure_Band": "Tenure_Band",
+}
+
+
+def build_employee_hashes(employee_data):
+    # Read whole columns once instead of building a Series per row
+    columns = {"Clarity_ID": employee_data["Clarity_ID"].tolist()}
+    for key, column in EMPLOYEE_METADATA_COLUMNS.items():
+        columns[key] = employee_data[column].tolist() if column in employee_data.columns else None
+
+    employee_hashes = {}
+    for i, slack_id in enumerate(employee_data["slack_id"].tolist()):
+        employee_hashes[slack_id] = {
+            key: values[i] if values is not None else None
+            for key, values in columns.items()
+        }
+    return employee_hashes
+
+
+class TranslationContext:
+    """
+    Lookup tables prepared once per run for the message transform: a direct
+    slack_id -> Clarity_ID dict and frozen bot sets for O(1) membership.
+    """
+    __slots__ = ("clarity_ids", "bot_ids", "excluded_authors")
+
+    def __init__(self, clarity_ids, bot_ids, excluded_authors):
+        self.clarity_ids = clarity_ids
+        self.bot_ids = bot_ids
+        self.excluded_authors = excluded_authors
+
+
+def build_translation_context(employee_hashes, list_of_bots_ids):
+    bot_ids = frozenset(list_of_bots_ids)
+    return TranslationContext(
+        clarity_ids={slack_id: emp["Clarity_ID"] for slack_id, emp in employee_hashes.items()},
+        bot_ids=bot_ids,
+        # Slackbot is not listed as a bot in users.json but never counts as an author
+        excluded_authors=bot_ids | {'USLACKBOT'},
+    )
+
+
+def anonymize_workspace(archive, employee_hashes, context):
+    """
+    Anonymize the workspace metadata (users and conversations) of an
+    InputArchive. Returns (users, conversations, conv_id_map) where
+    conv_id_map maps original conversation folder names to their hashed IDs.
+    """
+    channels = archive.metadata("channels.json")
+    groups = archive.metadata("groups.json", [])
+    dms = archive.metadata("dms.json", [])
+    mpims = archive.metadata("mpims.json", [])
+    users_json = archive.metadata("users.json")
+
+    users = []
+    conversations = []
+
+    # USERS - include all metadata
+    for u in users_json:
+        emp_data = employee_hashes.get(u["id"])
+        if emp_data and u["id"] not in context.bot_ids:
+            users.append(emp_data)
+
+    # CONVERSATIONS
+    conv_meta_list = dms + mpims + channels + groups
+    conv_id_map = {}  # Map original names to clarity IDs
+
+    for conv in conv_meta_list:
+        members = [
+            context.clarity_ids[m]
+            for m in conv.get("members", [])
+            if m in context.clarity_ids and m not in context.bot_ids
+        ]
+
+        if not members:
+            continue
+
+        is_dm = len(members) <= 3 or conv.get("is_im") or conv.get("is_mpim")
+        
+        # Use original conversation ID or name for hashing
+        original_conv_id = conv.get("id", conv.get("name", ""))
+        conv_id = generate_conversation_id(original_conv_id, is_dm)
+        conv_type = "dm" if is_dm else "channel"
+
+        conv_name = conv.get("name", conv.get("id", ""))
+        conv_id_map[conv_name] = conv_id
+
+        # Build conversation metadata
+        conv_data = {
+            "ConversationID": conv_id,
+            "Type": conv_type,
+            "Participants": ",".join(members),
+            "MemberCount": len(members),
+        }
+        
+        # Add created timestamp if present
+        if conv.get("created"):
+            conv_data["Created"] = conv.get("created")
+        
+        # Add creator (anonymized) if present
+        if conv.get("creator"):
+            creator_clarity = context.clarity_ids.get(conv.get("creator"))
+            if creator_clarity:
+                conv_data["Creator"] = creator_clarity
+        
+        # Add archive status
+        if conv.get("is_archived") is not None:
+            conv_data["IsArchived"] = conv.get("is_archived")
+        
+        
+        conversations.append(conv_data)
+
+    return users, conversations, conv_id_map
+
+
+# Per-process timestamp engine; its memos carry over between day files
+_timestamp_coarsener = TimestampCoarsener()
+
+
+def anonymize_messages(msgs, context, dropped=None, unmapped=None):
+    """
+    Anonymize the messages of a single day file, dropping bots and unmapped
+    users. Dropped messages are counted by reason in dropped (a Counter).
+    Users without a Clarity_ID that are left out (authors, editors, repliers
+    and reactors, bots excepted) are added to unmapped (a set).
+    """
+    if dropped is None:
+        dropped = Counter()
+    if unmapped is None:
+        unmapped = set()
+
+    # Bind the lookups once per file so the loop below only does local dict/set lookups
+    clarity_of = context.clarity_ids.get
+    bot_ids = context.bot_ids
+    excluded_authors = context.excluded_authors
+
+    # Timestamps are collected as (target dict, key) slots and coarsened in one batch per file
+    ts_slots = []
+    ts_values = []
+
+    anonymized_msgs = []
+
+    for msg in msgs:
+        if not isinstance(msg, dict):
+            dropped["not_a_message"] += 1
+            continue
+
+        user_id = msg.get("user")
+        if not user_id:
+            dropped["no_author"] += 1
+            continue
+        if user_id in excluded_authors:
+            dropped["bot"] += 1
+            continue
+
+        clarity = clarity_of(user_id)
+        if not clarity:
+            dropped["unmapped_user"] += 1
+            unmapped.add(user_id)
+            continue
+
+        # Create anonymized message in Slack format with rounded timestamps
+        anonymized_msg = {
+            'user': clarity,
+            'ts': None
+        }
+        ts_slots.append((anonymized_msg, 'ts'))
+        ts_values.append(msg.get('ts', '0'))
+        
+        # Add edited metadata if present
+        edited = msg.get('edited')
+        if edited:
+            edited_info = {}
+            if edited.get('ts'):
+                edited_info['ts'] = None
+                ts_slots.append((edited_info, 'ts'))
+                ts_values.append(edited.get('ts'))
+            if edited.get('user'):
+                editor_clarity = clarity_of(edited.get('user'))
+                if editor_clarity:
+                    edited_info['user'] = editor_clarity
+                elif edited.get('user') not in bot_ids:
+                    unmapped.add(edited.get('user'))
+            if edited_info:
+                anonymized_msg['edited'] = edited_info
+
+        # Add thread_ts if present (rounded)
+        if msg.get('thread_ts'):
+            anonymized_msg['thread_ts'] = None
+            ts_slots.append((anonymized_msg, 'thread_ts'))
+            ts_values.append(msg.get('thread_ts'))
+        
+        # Add latest_reply if present (rounded)
+        if msg.get('latest_reply'):
+            anonymized_msg['latest_reply'] = None
+            ts_slots.append((anonymized_msg, 'latest_reply'))
+            ts_values.append(msg.get('latest_reply'))
+        
+        # Add reply_count if present
+        if msg.get('reply_count'):
+            anonymized_msg['reply_count'] = msg.get('reply_count')
+        
+        # Add reply_users_count if present
+        if msg.get('reply_users_count'):
+            anonymized_msg['reply_users_count'] = msg.get('reply_users_count')
+        
+        # Add reply_users if present (anonymize user IDs)
+        reply_users = msg.get('reply_users')
+        if reply_users:
+            anonymized_reply_users = [
+                clarity_of(u)
+                for u in reply_users
+                if u not in bot_ids and clarity_of(u)
+            ]
+            if len(anonymized_reply_users) < len(reply_users):
+                unmapped.update(u for u in reply_users if u not in bot_ids and not clarity_of(u))
+            if anonymized_reply_users:
+                anonymized_msg['reply_users'] = anonymized_reply_users
+        
+        # Add replies metadata if present (anonymize user IDs)
+        replies = msg.get('replies')
+        if replies:
+            anonymized_replies = []
+            for reply in replies:
+                reply_user = reply.get('user')
+                if reply_user and reply_user not in bot_ids:
+                    clarity_user = clarity_of(reply_user)
+                    if clarity_user:
+                        anonymized_reply = {
+                            'user': clarity_user,
+                            'ts': None
+                        }
+                        ts_slots.append((anonymized_reply, 'ts'))
+                        ts_values.append(reply.get('ts', '0'))
+                        anonymized_replies.append(anonymized_reply)
+                    else:
+                        unmapped.add(reply_user)
+            if anonymized_replies:
+                anonymized_msg['replies'] = anonymized_replies
+
+        # Add reactions if present (with anonymized users, no reaction types)
+        reactions = msg.get('reactions')
+        if reactions:
+            anonymized_reactions = []
+            for reaction in reactions:
+                reaction_users = reaction.get('users', [])
+                anonymized_users = [
+                    clarity_of(u)
+                    for u in reaction_users
+                    if u not in bot_ids and clarity_of(u)
+                ]
+                if len(anonymized_users) < len(reaction_users):
+                    unmapped.update(u for u in reaction_users if u not in bot_ids and not clarity_of(u))
+                if anonymized_users:
+                    anonymized_reactions.append({
+                        'count': len(anonymized_users),
+                        'users': anonymized_users
+                    })
+            if anonymized_reactions:
+                anonymized_msg['reactions'] = anonymized_reactions
+        
+        # Add last_read if present
+        if msg.get('last_read'):
+            anonymized_msg['last_read'] = msg.get('last_read')
+
+        anonymized_msgs.append(anonymized_msg)
+
+    for (target, key), rounded in zip(ts_slots, _timestamp_coarsener.coarsen_many(ts_values)):
+        target[key] = rounded
+
+    return anonymized_msgs
+
+
+def anonymize_day_file(content, context, dropped=None, unmapped=None):
+    """
+    Decode and anonymize the raw bytes of one day file; unreadable files yield
+    no messages. Dropped messages and malformed files are counted by reason in
+    dropped (a Counter), unmapped users are collected in unmapped (see
+    anonymize_messages).
+    """
+    if dropped is None:
+        dropped = Counter()
+
+    try:
+        msgs = decode_json_bytes(content)
+    except Exception:
+        # Skip malformed files without exposing paths
+        dropped["malformed_file"] += 1
+        return []
+
+    if not isinstance(msgs, list):
+        dropped["malformed_file"] += 1
+        return []
+    if not msgs:
+        return []
+
+    file_dropped = Counter()
+    try:
+        anonymized_msgs = anonymize_messages(msgs, context, file_dropped, unmapped)
+    except Exception:
+        # Skip problematic files without exposing internal details, but count what was lost
+        dropped["transform_error"] += len(msgs)
+        return []
+    dropped.update(file_dropped)
+    return anonymized_msgs
+
+
+def iter_mapped_day_files(archive_index, conv_id_map, dropped=None):
+    """
+    Yield (conv_id, date, member_path) for the day files of mapped
+    conversations. Day files of other conversations are counted in dropped.
+    """
+    if dropped is None:
+        dropped = Counter()
+
+    if not archive_index["conversations"]:
+        raise ValueError("No message files found in Slack export. Please ensure your export includes message history data.")
+
+    # Only visit the day files belonging to conversations we could map
+    for folder, day_files in archive_index["conversations"].items():
+        folder_name = folder.split("/")[-1]
+        conv_id = conv_id_map.get(folder_name)
+
+        if not conv_id:
+            dropped["unmapped_conversation"] += len(day_files)
+            continue
+
+        for date, file in day_files:
+            yield conv_id, date, file
+
+
+def count_mapped_day_files(archive_index, conv_id_map):
+    """(conversations, day files) that iter_mapped_day_files yields, for progress reporting."""
+    mapped = [
+        day_files for folder, day_files in archive_index["conversations"].items()
+        if conv_id_map.get(folder.split("/")[-1])
+    ]
+    return len(mapped), sum(len(day_files) for day_files in mapped)
+
+
+def read_member(zip_object, file):
+    try:
+        return zip_object.read(file)
+    except Exception:
+        # Unreadable members decode as malformed and yield no messages
+        return b""
+
+
+# Day files sent to a worker per task, and tasks kept in flight per worker
+PARALLEL_BATCH_SIZE = 64
+PARALLEL_TASKS_PER_WORKER = 2
+
+_worker_context = {}
+
+# Modules the fork server imports once, so pool workers start without importing them again
+POOL_PRELOAD_MODULES = ["pipeline", "processors"]
+
+
+def process_pool_context():
+    """
+    multiprocessing context for worker pools. Pools are started from threads
+    of a multi-threaded process (a BackgroundJob in the Streamlit server),
+    and a forked child can inherit a lock some other thread was holding, so
+    workers come from a fork server instead, or are spawned where there is
+    none (Windows).
+    """
+    import multiprocessing
+
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(POOL_PRELOAD_MODULES)
+    return context
+
+
+def _init_message_worker(context):
+    # Ship the translation context to each worker once, not per task
+    _worker_context["context"] = context
+
+
+def _anonymize_day_file_batch(batch):
+    # Returns the results with the drop counts of the whole batch and the day files with unmapped users
+    dropped = Counter()
+    results = []
+    unmapped_days = []
+    for conv_id, date, content in batch:
+        unmapped = set()
+        anonymized_msgs = None if content is None else anonymize_day_file(
+            content, _worker_context["context"], dropped, unmapped
+        )
+        results.append((conv_id, date, anonymized_msgs))
+        if unmapped:
+            unmapped_days.append((conv_id, date))
+    return results, dropped, unmapped_days
+
+
+def _read_day_file(zip_object, file, report):
+    with report.stage("zip_read"):
+        content = read_member(zip_object, file)
+    report.count("files_read")
+    report.count("bytes_decompressed", len(content))
+    return content
+
+
+def transform_day_files(zip_object, day_files, context, workers=1, report=None, unmapped_days=None):
+    """
+    Yield (conv_id, date, messages) for every (conv_id, date, member_path) in
+    day_files, in the same order. Entries whose member_path is None are passed
+    through with messages None, without being read. (conv_id, date) of day
+    files that mention users without a Clarity_ID are added to unmapped_days
+    (a set) before they are yielded.
+
+    With workers > 1, batches of day files are transformed in a process pool.
+    Only a bounded number of batches is in flight, and results are yielded in
+    input order so the output matches the serial path exactly.
+
+    Reads, bytes decompressed, dropped messages and the time spent reading
+    and transforming are added to report. With workers > 1 the transform time
+    is the time spent waiting for the workers.
+    """
+    report = report if report is not None else ProcessingReport()
+    day_files = iter(day_files)
+
+    if workers <= 1:
+        for conv_id, date, file in day_files:
+            if file is None:
+                yield conv_id, date, None
+                continue
+            content = _read_day_file(zip_object, file, report)
+            unmapped = set()
+            with report.stage("message_transform"):
+                anonymized_msgs = anonymize_day_file(content, context, report.dropped, unmapped)
+            if unmapped and unmapped_days is not None:
+                unmapped_days.add((conv_id, date))
+            yield conv_id, date, anonymized_msgs
+        return
+
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    from itertools import islice
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=process_pool_context(),
+        initializer=_init_message_worker,
+        initargs=(context,),
+    ) as executor:
+        pending = deque()
+        while True:
+            batch = [
+                (conv_id, date, None if file is None else _read_day_file(zip_object, file, report))
+                for conv_id, date, file in islice(day_files, PARALLEL_BATCH_SIZE)
+            ]
+            if batch:
+                pending.append(executor.submit(_anonymize_day_file_batch, batch))
+            if not pending:
+                break
+            if batch and len(pending) < workers * PARALLEL_TASKS_PER_WORKER:
+                continue
+
+            with report.stage("message_transform"):
+                results, dropped, batch_unmapped_days = pending.popleft().result()
+            report.merge_dropped(dropped)
+            if unmapped_days is not None:
+                unmapped_days.update(batch_unmapped_days)
+            yield from results
+
+
+def iter_anonymized_messages(zip_object, archive_index, conv_id_map, context, workers=1, report=None):
+    """
+    Yield (conv_id, date, messages) one day file at a time, so callers can
+    write each result out before the next file is read. Day files without
+    any kept messages are skipped.
+    """
+    report = report if report is not None else ProcessingReport()
+    day_files = iter_mapped_day_files(archive_index, conv_id_map, report.dropped)
+    for conv_id, date, anonymized_msgs in transform_day_files(
+        zip_object, day_files, context, workers=workers, report=report
+    ):
+        if anonymized_msgs:
+            yield conv_id, date, anonymized_msgs
+
+
+def extract_zip_files(zip_uploaded_file, employee_data, list_of_bots_ids, workers=1, report=None, aggregates=False):
+    """
+    Anonymize the whole export in memory. Returns {"users", "conversations",
+    "messages"}, where messages is a MessageStore holding every kept message
+    as compact JSON; its iter_days() yields the day files in the JSON shape
+    of the output archive. zip_uploaded_file is the export or an
+    InputArchive. With aggregates, output["aggregates"] also holds the
+    interaction tables of interaction_aggregates, counted in the same pass.
+    """
+    report = report if report is not None else ProcessingReport()
+    employee_hashes = build_employee_hashes(employee_data)
+    context = build_translation_context(employee_hashes, list_of_bots_ids)
+
+    output = {
+        "users": [],
+        "conversations": [],
+        "messages": MessageStore(),
+    }
+    interactions = InteractionAggregates() if aggregates else None
+
+    with input_archive(zip_uploaded_file, report) as archive:
+        with report.stage("metadata_parse"):
+            output["users"], output["conversations"], conv_id_map = anonymize_workspace(
+                archive, employee_hashes, context
+            )
+
+        for conv_id, date, anonymized_msgs in iter_anonymized_messages(
+            archive.zip, archive.index, conv_id_map, context, workers=workers, report=report
+        ):
+            with report.stage("message_store"):
+                output["messages"].append_day(conv_id, date, anonymized_msgs)
+            if interactions is not None:
+                with report.stage("aggregates"):
+                    interactions.add_day(conv_id, date, anonymized_msgs)
+            report.count("messages_kept", len(anonymized_msgs))
+
+    # Validate that we have some messages
+    if output["messages"].message_count == 0:
+        raise ValueError(NO_MESSAGES_ERROR)
+
+    if interactions is not None:
+        output["aggregates"] = interactions.tables()
+
+    return output
+
+
+# Day files anonymized for the quick preview shown while a full run is going
+PREVIEW_DAY_FILES = 20
+
+
+def preview_anonymized_export(zip_uploaded_file, employee_data, list_of_bots_ids, day_files=PREVIEW_DAY_FILES):
+    """
+    Anonymize the workspace metadata and only the first day_files day files,
+    so a preview can be shown within seconds while the full run continues.
+    Nothing is written. Returns the users, conversations, message_count,
+    day_file_count and sample keys of a stream_anonymized_export summary,
+    with the counts covering the previewed day files only.
+    """
+    from itertools import islice
+
+    employee_hashes = build_employee_hashes(employee_data)
+    context = build_translation_context(employee_hashes, list_of_bots_ids)
+    preview = {"users": [], "conversations": [], "message_count": 0, "day_file_count": 0, "sample": None}
+
+    with input_archive(zip_uploaded_file) as archive:
+        preview["users"], preview["conversations"], conv_id_map = anonymize_workspace(
+            archive, employee_hashes, context
+        )
+        first_day_files = islice(iter_mapped_day_files(archive.index, conv_id_map), day_files)
+        for conv_id, date, anonymized_msgs in transform_day_files(archive.zip, first_day_files, context):
+            if not anonymized_msgs:
+                continue
+            preview["message_count"] += len(anonymized_msgs)
+            preview["day_file_count"] += 1
+            if preview["sample"] is None:
+                preview["sample"] = {"conversation": conv_id, "date": date, "messages": anonymized_msgs[:3]}
+
+    return preview
+
+
+def stream_anonymized_export(
+    zip_uploaded_file,
+    employee_data,
+    list_of_bots_ids,
+    output_file,
+    workers=1,
+    compact=False,
+    compression=DEFAULT_COMPRESSION,
+    compression_level=None,
+    compress_threads=1,
+    previous_archive=None,
+    previous_manifest=None,
+    report=None,
+    output_format=DEFAULT_OUTPUT_FORMAT,
+    progress=None,
+    aggregates=False,
+):
+    """
+    Anonymize the export one day file at a time, writing each result straight
+    into the output archive so memory stays flat regardless of export size.
+    zip_uploaded_file is the export, or the InputArchive given to combine_data
+    so the export is opened, indexed and its metadata parsed only once.
+    Returns a summary (users, conversations, message and day file counts, a
+    small message sample and the manifest of this run) for the UI. With
+    workers > 1 the message transform runs in a process pool; the archive
+    contents are identical either way. compact writes JSON without
+    indentation. compression, compression_level and compress_threads
+    configure the output ArchiveWriter.
+
+    previous_archive and previous_manifest are the output and manifest of an
+    earlier run over an older export. Day files whose source is unchanged
+    since then are copied from previous_archive instead of being
+    re-anonymized, which keeps repeated runs over cumulative exports cheap.
+
+    Stage timings, counts and dropped messages are collected in report (pass
+    the ProcessingReport given to combine_data to include its stages), written
+    into the archive as processing_report.json and returned as summary["report"].
+
+    output_format "json" writes one file per conversation and day; "parquet"
+    and "ndjson" write users, conversations and messages as three tables
+    instead (see table_output). previous_archive is only used for "json".
+
+    progress, when given, is called with {"day_files_done", "day_files_total",
+    "conversations_done", "conversations_total", "messages"} before the first
+    and after every day file. An exception it raises (e.g. to cancel) aborts
+    the run and discards the archive.
+
+    aggregates adds the interaction tables of interaction_aggregates (reply
+    and reaction edges, messages per user per day, thread sizes) under
+    aggregates/, in the output format, counted while the day files are
+    written. Reused day files are read back from previous_archive to count them.
+    """
+    check_output_format(output_format)
+    if output_format != "json":
+        previous_archive = None
+
+    report = report if report is not None else ProcessingReport()
+    employee_hashes = build_employee_hashes(employee_data)
+    context = build_translation_context(employee_hashes, list_of_bots_ids)
+    manifest = new_manifest(context, compact, output_format)
+    entries = manifest["entries"]
+
+    summary = {
+        "users": [],
+        "conversations": [],
+        "message_count": 0,
+        "day_file_count": 0,
+        "reused_day_files": 0,
+        "sample": None,  # {"conversation": conv_id, "date": date, "messages": [...]}
+        "manifest": manifest,
+        "report": None,
+    }
+    interactions = InteractionAggregates() if aggregates else None
+
+    with input_archive(zip_uploaded_file, report) as archive, ArchiveWriter(
+        output_file, compression=compression, level=compression_level, threads=compress_threads
+    ) as zipf, (
+        ZipFile(previous_archive, 'r') if previous_archive is not None else nullcontext()
+    ) as previous_zip, (
+        TableWriter(zipf, output_format) if output_format != "json" else nullcontext()
+    ) as tables:
+        zip_object = archive.zip
+        archive_index = archive.index
+        with report.stage("metadata_parse"):
+            summary["users"], summary["conversations"], conv_id_map = anonymize_workspace(
+                archive, employee_hashes, context
+            )
+
+        def write_entry(name, data):
+            with report.stage("serialization"):
+                data = dumps_json(data, compact)
+            with report.stage("compression"):
+                zipf.writestr(name, data)
+
+        if tables is None:
+            write_entry("users.json", summary["users"])
+            write_entry("conversations.json", summary["conversations"])
+        else:
+            with report.stage("serialization"):
+                tables.write_table("users", summary["users"])
+                tables.write_table("conversations", summary["conversations"])
+
+        conversations_total, day_files_total = count_mapped_day_files(archive_index, conv_id_map)
+        counts = {
+            "day_files_done": 0,
+            "day_files_total": day_files_total,
+            "conversations_done": 0,
+            "conversations_total": conversations_total,
+            "messages": 0,
+        }
+
+        def track_progress(results):
+            if progress is not None:
+                progress(dict(counts))
+            current = None
+            for result in results:
+                if result[0] != current:
+                    counts["conversations_done"] += current is not None
+                    current = result[0]
+                yield result
+                # The loop below has finished this day file once it asks for the next one
+                counts["day_files_done"] += 1
+                counts["messages"] = summary["message_count"]
+                if progress is not None:
+                    progress(dict(counts))
+            counts["conversations_done"] = conversations_total
+            if progress is not None:
+                progress(dict(counts))
+
+        reusable = reusable_entries(previous_manifest, manifest) if previous_zip is not None else {}
+        previous_names = set(previous_zip.namelist()) if reusable else set()
+
+        def plan_day_files():
+            # Replace the path of unchanged day files with None so they are not read again
+            for conv_id, date, file in iter_mapped_day_files(archive_index, conv_id_map, report.dropped):
+                info = zip_object.getinfo(file)
+                key = f"{conv_id}/{date}"
+                previous = reusable.get(key)
+                if (
+                    previous is not None
+                    and previous.get("crc") == info.CRC
+                    and previous.get("size") == info.file_size
+                    and (previous.get("messages") == 0 or f"messages/{key}.json" in previous_names)
+                ):
+                    entries[key] = previous
+                    yield conv_id, date, None
+                else:
+                    entries[key] = {"crc": info.CRC, "size": info.file_size, "messages": 0, "unmapped": False}
+                    yield conv_id, date, file
+
+        unmapped_days = set()
+        for conv_id, date, anonymized_msgs in track_progress(transform_day_files(
+            zip_object, plan_day_files(), context, workers=workers, report=report, unmapped_days=unmapped_days
+        )):
+            name = f"messages/{conv_id}/{date}.json"
+            entry = entries[f"{conv_id}/{date}"]
+            if (conv_id, date) in unmapped_days:
+                # Reprocessed once one of these users gets a Clarity_ID (see reusable_entries)
+                entry["unmapped"] = True
+
+            if anonymized_msgs is None:
+                summary["reused_day_files"] += 1
+                if not entry["messages"]:
+                    continue
+                with report.stage("compression"):
+                    zipf.copy_entry(previous_zip, name)
+                if summary["sample"] is None or interactions is not None:
+                    anonymized_msgs = decode_json_bytes(previous_zip.read(name))
+            elif anonymized_msgs:
+                entry["messages"] = len(anonymized_msgs)
+                if tables is None:
+                    write_entry(name, anonymized_msgs)
+                else:
+                    with report.stage("serialization"):
+                        tables.add_messages(conv_id, date, anonymized_msgs)
+            else:
+                continue
+
+            if interactions is not None:
+                with report.stage("aggregates"):
+                    interactions.add_day(conv_id, date, anonymized_msgs)
+            summary["message_count"] += entry["messages"]
+            summary["day_file_count"] += 1
+            if summary["sample"] is None:
+                summary["sample"] = {"conversation": conv_id, "date": date, "messages": anonymized_msgs[:3]}
+
+        if summary["message_count"] == 0:
+            raise ValueError(NO_MESSAGES_ERROR)
+
+        if tables is not None:
+            # Finishes the streamed messages entry, before any other entry is added
+            with report.stage("compression"):
+                tables.close()
+
+        if interactions is not None:
+            for name, rows in interactions.tables().items():
+                report.count(f"aggregate_{name}_rows", len(rows))
+                if tables is None:
+                    write_entry(f"{AGGREGATES_DIR}/{name}.json", rows)
+                else:
+                    with report.stage("serialization"):
+                        tables.write_table(f"{AGGREGATES_DIR}/{name}", rows, AGGREGATE_TABLES[name])
+
+        # Wait for pending compression so it is part of the report written below
+        with report.stage("compression"):
+            zipf.flush()
+        report.count("users", len(summary["users"]))
+        report.count("conversations", len(summary["conversations"]))
+        report.count("day_files_written", summary["day_file_count"])
+        report.count("day_files_reused", summary["reused_day_files"])
+        report.count("messages_kept", summary["message_count"])
+        summary["report"] = report.as_dict()
+        zipf.writestr(REPORT_NAME, dumps_json(summary["report"], compact))
+
+    return summary
@@ -1,52 +1,168 @@
-from presidio_analyzer import AnalyzerEngine, PatternRecognizer, Pattern
-from presidio_analyzer.nlp_engine import NlpEngineProvider
-from presidio_anonymizer import AnonymizerEngine
-from presidio_anonymizer.entities import OperatorConfig
-
-def create_presidio_engines():
-    """
-    Initialize Presidio Analyzer + Anonymizer.
-    """
-
-    nlp_configuration = {
-        "nlp_engine_name": "spacy",
-        "models": [{"lang_code": "en", "model_name": "en_core_web_lg"}],
-    }
-
-    provider = NlpEngineProvider(nlp_configuration=nlp_configuration)
-    nlp_engine = provider.create_engine()
-
-    analyzer = AnalyzerEngine(
-        nlp_engine=nlp_engine,
-        supported_languages=["en"],
-    )
-
-    anonymizer = AnonymizerEngine()
-
-    gmail_pattern = Pattern(
-        name="gmail_pattern",
-        regex=r"[A-Za-z0-9._%+-]+@gmail\.com",
-        score=0.9,
-    )
-    gmail_recognizer = PatternRecognizer(
-        supported_entity="EMAIL_ADDRESS",
-        patterns=[gmail_pattern],
-    )
-    analyzer.registry.add_recognizer(gmail_recognizer)
-
-    return analyzer, anonymizer
-
-
-DEFAULT_OPERATORS = {
-    # Fallback for anything not explicitly set
-    "DEFAULT": OperatorConfig("replace", {"new_value": "<PII>"}),
-
-    "EMAIL_ADDRESS": OperatorConfig("replace", {"new_value": "<EMAIL>"}),
-    "PERSON":        OperatorConfig("replace", {"new_value": "<NAME>"}),
-    "LOCATION":      OperatorConfig("replace", {"new_value": "<LOCATION>"}),
-    "PHONE_NUMBER":  OperatorConfig("replace", {"new_value": "<PHONE>"}),
-    "IP_ADDRESS":    OperatorConfig("replace", {"new_value": "<IP>"}),
-    "CREDIT_CARD":   OperatorConfig("replace", {"new_value": "<CC>"}),
-    "IBAN_CODE":     OperatorConfig("replace", {"new_value": "<IBAN>"}),
-    "US_SSN":        OperatorConfig("replace", {"new_value": "<SSN>"}),
-}
\ No newline at end of file
+import threading
+import time
+
+from memory_usage import current_rss_mb
+
+# Presidio and spaCy are imported inside the functions below, so importing this
+# module (or the app) does not load NLP libraries that may never be used.
+
+SPACY_MODELS = {
+    "sm": "en_core_web_sm",
+    "md": "en_core_web_md",
+    "lg": "en_core_web_lg",
+}
+DEFAULT_MODEL_SIZE = "lg"
+
+# Presidio reads tokens, lemmas and entities only; the dependency parse is never used
+UNUSED_SPACY_PIPES = ["parser", "senter"]
+
+REPLACEMENTS = {
+    # Fallback for anything not explicitly set
+    "DEFAULT": "<PII>",
+
+    "EMAIL_ADDRESS": "<EMAIL>",
+    "PERSON":        "<NAME>",
+    "LOCATION":      "<LOCATION>",
+    "PHONE_NUMBER":  "<PHONE>",
+    "IP_ADDRESS":    "<IP>",
+    "CREDIT_CARD":   "<CC>",
+    "IBAN_CODE":     "<IBAN>",
+    "US_SSN":        "<SSN>",
+}
+
+_engines = {}
+_engines_lock = threading.Lock()
+_load_stats = {}
+
+
+def create_presidio_engines(model_size=DEFAULT_MODEL_SIZE, entities=None):
+    """
+    Initialize Presidio Analyzer + Anonymizer.
+
+    model_size picks the spaCy model (sm, md or lg); it is loaded without the
+    pipes Presidio does not use. model_size=None skips spaCy entirely and
+    only detects what the pattern recognizers can. Only recognizers for entities (default: the
+    entities of DEFAULT_OPERATORS) are registered, which does not change the
+    results for those entities.
+    """
+    from presidio_analyzer import AnalyzerEngine, PatternRecognizer, Pattern
+    from presidio_analyzer.nlp_engine import NoOpNlpEngine, SpacyNlpEngine
+    from presidio_analyzer.recognizer_registry import RecognizerRegistryProvider
+    from presidio_anonymizer import AnonymizerEngine
+
+    if model_size is not None and model_size not in SPACY_MODELS:
+        raise ValueError(f"Unknown spaCy model size '{model_size}'. Choose one of: {', '.join(SPACY_MODELS)}")
+    if entities is None:
+        entities = [entity for entity in REPLACEMENTS if entity != "DEFAULT"]
+
+    if model_size is None:
+        # No spaCy at all: only recognizers that work without NLP (no PERSON/LOCATION)
+        nlp_engine = NoOpNlpEngine(models=[{"lang_code": "en", "model_name": "none"}])
+        nlp_engine.load()
+    else:
+        import spacy
+
+        model_name = SPACY_MODELS[model_size]
+        nlp_engine = SpacyNlpEngine(models=[{"lang_code": "en", "model_name": model_name}])
+        # Same as nlp_engine.load() (which downloads missing models), but the unused pipes are never loaded
+        if not spacy.util.is_package(model_name):
+            _download_spacy_model(model_name)
+        try:
+            nlp_engine.nlp = {"en": spacy.load(model_name, exclude=UNUSED_SPACY_PIPES)}
+        except OSError:
+            raise OSError(_missing_model_message(model_name)) from None
+
+    # The registry AnalyzerEngine would build by default, minus recognizers for other entities
+    registry = RecognizerRegistryProvider(
+        registry_configuration={"supported_languages": ["en"]}
+    ).create_recognizer_registry()
+    if model_size is not None:
+        registry.add_nlp_recognizer(nlp_engine=nlp_engine)
+    registry.recognizers = [
+        recognizer for recognizer in registry.recognizers
+        if set(recognizer.supported_entities) & set(entities)
+    ]
+
+    analyzer = AnalyzerEngine(
+        nlp_engine=nlp_engine,
+        registry=registry,
+        supported_languages=["en"],
+    )
+
+    anonymizer = AnonymizerEngine()
+
+    gmail_pattern = Pattern(
+        name="gmail_pattern",
+        regex=r"[A-Za-z0-9._%+-]+@gmail\.com",
+        score=0.9,
+    )
+    gmail_recognizer = PatternRecognizer(
+        supported_entity="EMAIL_ADDRESS",
+        patterns=[gmail_pattern],
+    )
+    analyzer.registry.add_recognizer(gmail_recognizer)
+
+    return analyzer, anonymizer
+
+
+def _missing_model_message(model_name):
+    return f"spaCy model '{model_name}' is not installed. Install it with: python -m spacy download {model_name}"
+
+
+def _download_spacy_model(model_name):
+    import spacy.cli
+
+    try:
+        spacy.cli.download(model_name)
+    except (Exception, SystemExit):
+        # spacy.cli.download exits when pip fails, e.g. without network access
+        raise OSError(_missing_model_message(model_name)) from None
+
+
+def get_presidio_engines(model_size=DEFAULT_MODEL_SIZE):
+    """
+    Process-wide (analyzer, anonymizer) for model_size, created on first use.
+    Load time and memory of each load are available from engine_load_stats().
+    """
+    engines = _engines.get(model_size)
+    if engines is not None:
+        return engines
+
+    with _engines_lock:
+        engines = _engines.get(model_size)
+        if engines is None:
+            rss_before = current_rss_mb()
+            start = time.perf_counter()
+            engines = create_presidio_engines(model_size)
+            rss_after = current_rss_mb()
+            _load_stats[model_size] = {
+                "model": SPACY_MODELS.get(model_size),
+                "seconds": time.perf_counter() - start,
+                "rss_mb": rss_after,
+                "rss_delta_mb": rss_after - rss_before if rss_after is not None and rss_before is not None else None,
+            }
+            _engines[model_size] = engines
+    return engines
+
+
+def engine_load_stats():
+    """{model_size: {"model", "seconds", "rss_mb", "rss_delta_mb"}} for the engines loaded so far."""
+    return {model_size: dict(stats) for model_size, stats in _load_stats.items()}
+
+
+def _build_default_operators():
+    from presidio_anonymizer.entities import OperatorConfig
+
+    return {
+        entity: OperatorConfig("replace", {"new_value": replacement})
+        for entity, replacement in REPLACEMENTS.items()
+    }
+
+
+def __getattr__(name):
+    # DEFAULT_OPERATORS is built on first access, which imports presidio_anonymizer
+    if name == "DEFAULT_OPERATORS":
+        operators = _build_default_operators()
+        globals()["DEFAULT_OPERATORS"] = operators
+        return operators
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,62 @@
+"""
+Timings and counters of one anonymization run, written into the output
+archive as processing_report.json. Only stage names, durations, counts and
+drop reasons are recorded: no file paths, names or IDs.
+"""
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+REPORT_NAME = "processing_report.json"
+REPORT_VERSION = 1
+
+# Drop reasons counted per day file rather than per message
+FILE_DROP_REASONS = ("malformed_file", "unmapped_conversation")
+
+
+class ProcessingReport:
+    """
+    Accumulates seconds per stage, counters (files read, bytes decompressed,
+    messages kept, ...) and dropped messages/day files by reason.
+    """
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self.stages = {}
+        self.counters = Counter()
+        self.dropped = Counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def drop(self, reason, amount=1):
+        self.dropped[reason] += amount
+
+    def merge_dropped(self, dropped):
+        self.dropped.update(dropped)
+
+    def as_dict(self):
+        return {
+            "version": REPORT_VERSION,
+            "stages_seconds": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            # Wall time since the report was created, including time outside the stages
+            "elapsed_seconds": round(time.perf_counter() - self._started, 4),
+            "counters": dict(self.counters),
+            "dropped_messages": {
+                reason: count for reason, count in self.dropped.items() if reason not in FILE_DROP_REASONS
+            },
+            "dropped_day_files": {
+                reason: count for reason, count in self.dropped.items() if reason in FILE_DROP_REASONS
+            },
+        }
@@ -1,62 +1,429 @@
-import pandas as pd
-from typing import List
-from presidio_analyzer import AnalyzerEngine
-from presidio_anonymizer import AnonymizerEngine
-
-
-def anonymize_text(
-    text: str,
-    analyzer: AnalyzerEngine,
-    anonymizer: AnonymizerEngine,
-    operators: dict,
-    language: str = "en",
-) -> str:
-    if not isinstance(text, str) or text.strip() == "":
-        return text
-
-    results = analyzer.analyze(
-        text=text,
-        entities=list(operators.keys()),
-        language=language,
-    )
-
-    if not results:
-        return text
-
-    anonymized_result = anonymizer.anonymize(
-        text=text,
-        analyzer_results=results,
-        operators=operators,
-    )
-
-    return anonymized_result.text
-
-
-def anonymize_dataframe(
-    df: pd.DataFrame,
-    analyzer: AnalyzerEngine,
-    anonymizer: AnonymizerEngine,
-    operators: dict,
-    columns: List[str],
-) -> pd.DataFrame:
-    df = df.copy()
-
-    for col in columns:
-        if col not in df.columns:
-            continue
-
-        # Only anonymize likely-text columns
-        if df[col].dtype == "object":
-            df[col] = df[col].astype(str).apply(
-                lambda x: anonymize_text(
-                    x,
-                    analyzer=analyzer,
-                    anonymizer=anonymizer,
-                    operators=operators,
-                )
-            )
-        else:
-            # If you want to be extra paranoid, cast and run anyway.
-            pass
-
-    return df
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+import weakref
+import numpy as np
+import pandas as pd
+from typing import TYPE_CHECKING, List, Optional, Union
+
+if TYPE_CHECKING:
+    # Only for annotations; Presidio is imported when text is actually analyzed
+    from presidio_analyzer import AnalyzerEngine
+    from presidio_anonymizer import AnonymizerEngine
+
+from analysis_cache import AnalysisCache, text_key
+from pipeline import detect_delimiter, process_pool_context
+from presidio_setup import create_presidio_engines
+
+# Cells per spaCy nlp.pipe batch in anonymize_dataframe
+DEFAULT_BATCH_SIZE = 256
+
+# Most distinct values sent to a worker process per task in parallel mode
+PARALLEL_SHARD_SIZE = 1024
+# Smaller shards when there are few values, so every worker gets several
+PARALLEL_SHARDS_PER_WORKER = 4
+
+# Rows held in memory at a time by anonymize_csv
+DEFAULT_CHUNK_ROWS = 50_000
+
+# Detection tiers per column: full NLP analysis, recognizers that need no NLP
+# pipeline only, or pick one of the two from the values of the column
+DETECTION_TIERS = ("ner", "pattern", "auto")
+
+_worker_state = {}
+_pattern_analyzers = weakref.WeakKeyDictionary()
+
+
+def anonymize_text(
+    text: str,
+    analyzer: AnalyzerEngine,
+    anonymizer: AnonymizerEngine,
+    operators: dict,
+    language: str = "en",
+    entities: Optional[List[str]] = None,
+) -> str:
+    if not isinstance(text, str) or text.strip() == "":
+        return text
+
+    results = analyzer.analyze(
+        text=text,
+        entities=list(operators.keys()) if entities is None else entities,
+        language=language,
+    )
+
+    return _apply_results(text, results, anonymizer, operators)
+
+
+def _apply_results(text: str, results, anonymizer: AnonymizerEngine, operators: dict) -> str:
+    if not results:
+        return text
+
+    anonymized_result = anonymizer.anonymize(
+        text=text,
+        analyzer_results=results,
+        operators=operators,
+    )
+
+    return anonymized_result.text
+
+
+def pattern_analyzer(analyzer: AnalyzerEngine) -> AnalyzerEngine:
+    """
+    AnalyzerEngine with the recognizers of analyzer that do not depend on the
+    NLP pipeline (regexes, phone number parsing, ...) and no NLP pipeline
+    itself, built once per analyzer.
+    """
+    cached = _pattern_analyzers.get(analyzer)
+    if cached is not None:
+        return cached
+
+    from presidio_analyzer import AnalyzerEngine, RecognizerRegistry
+    from presidio_analyzer.nlp_engine import NoOpNlpEngine
+    from presidio_analyzer.predefined_recognizers import SpacyRecognizer
+
+    languages = analyzer.supported_languages
+    nlp_engine = NoOpNlpEngine(models=[{"lang_code": language, "model_name": "none"} for language in languages])
+    nlp_engine.load()
+    registry = RecognizerRegistry(
+        # Stanza and transformers recognizers derive from SpacyRecognizer too
+        recognizers=[recognizer for recognizer in analyzer.registry.recognizers if not isinstance(recognizer, SpacyRecognizer)],
+        supported_languages=languages,
+    )
+    cached = _pattern_analyzers[analyzer] = AnalyzerEngine(
+        nlp_engine=nlp_engine,
+        registry=registry,
+        supported_languages=languages,
+    )
+    return cached
+
+
+def choose_detection_tier(
+    texts: List[str],
+    analyzer: AnalyzerEngine,
+    operators: dict,
+    language: str = "en",
+) -> str:
+    """
+    "pattern" when the recognizers of pattern_analyzer match every text
+    entirely (a column of emails, phone numbers, ...), otherwise "ner".
+    Free text keeps the full analysis even if the pattern recognizers find
+    everything in it, since the names NER is there for are rare.
+    """
+    analyzer = pattern_analyzer(analyzer)
+    entities = list(operators.keys())
+    for text in texts:
+        if not isinstance(text, str) or text.strip() == "":
+            continue
+        if not _fully_matched(text, analyzer.analyze(text=text, entities=entities, language=language)):
+            return "ner"
+    return "pattern"
+
+
+def _fully_matched(text: str, results) -> bool:
+    covered = bytearray(len(text))
+    for result in results:
+        covered[result.start:result.end] = b"\x01" * (result.end - result.start)
+    return all(covered[i] or char.isspace() for i, char in enumerate(text))
+
+
+def analysis_config_digest(analyzer: AnalyzerEngine, operators: dict, language: str = "en") -> str:
+    """Digest of everything besides the text that decides the anonymized output."""
+    config = {
+        "language": language,
+        "models": getattr(analyzer.nlp_engine, "models", None),
+        "recognizers": sorted(
+            [
+                recognizer.name,
+                recognizer.supported_language,
+                sorted(recognizer.supported_entities),
+                [[pattern.regex, pattern.score] for pattern in getattr(recognizer, "patterns", None) or []],
+            ]
+            for recognizer in analyzer.registry.recognizers
+        ),
+        "operators": {entity: [config.operator_name, config.params] for entity, config in operators.items()},
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def anonymize_texts(
+    texts: List[str],
+    analyzer: AnalyzerEngine,
+    anonymizer: AnonymizerEngine,
+    operators: dict,
+    language: str = "en",
+    batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+    cache: Optional[AnalysisCache] = None,
+    executor=None,
+    tier: str = "ner",
+    workers: int = 1,
+) -> List[str]:
+    """
+    Same as anonymize_text for every item of texts. The NLP pipeline runs over
+    batch_size texts at a time (spaCy nlp.pipe); batch_size=None analyzes
+    them one at a time. Texts found in cache skip analysis entirely.
+    executor is an optional pool from create_anonymizer_pool with workers
+    processes; the texts are then analyzed in shards by its workers, with
+    their own engines.
+    tier is one of DETECTION_TIERS; "pattern" skips the NLP pipeline and
+    only runs the recognizers that do not need it (see pattern_analyzer).
+    """
+    if tier not in DETECTION_TIERS:
+        raise ValueError(f"Unknown detection tier '{tier}'. Choose one of: {', '.join(DETECTION_TIERS)}")
+    if tier == "auto":
+        tier = choose_detection_tier(texts, analyzer, operators, language=language)
+    if tier == "pattern":
+        analyzer = pattern_analyzer(analyzer)
+
+    entities = list(operators.keys())
+    anonymized = list(texts)
+
+    # Empty cells are returned unchanged, exactly like anonymize_text
+    positions = [i for i, text in enumerate(anonymized) if isinstance(text, str) and text.strip() != ""]
+
+    keys = {}
+    if cache is not None and positions:
+        config_digest = analysis_config_digest(analyzer, operators, language)
+        keys = {i: text_key(config_digest, anonymized[i]) for i in positions}
+        cached = cache.get_many(list(keys.values()))
+        remaining = []
+        for i in positions:
+            value = cached.get(keys[i])
+            if value is None:
+                remaining.append(i)
+            else:
+                anonymized[i] = value
+        positions = remaining
+
+    if executor is not None:
+        shard_size = max(1, min(PARALLEL_SHARD_SIZE, -(-len(positions) // (workers * PARALLEL_SHARDS_PER_WORKER))))
+        shards = [positions[start:start + shard_size] for start in range(0, len(positions), shard_size)]
+        # map returns the shards in submission order
+        shard_texts = [[anonymized[i] for i in shard] for shard in shards]
+        for shard, results in zip(shards, executor.map(_anonymize_shard, shard_texts, [tier] * len(shards))):
+            for i, value in zip(shard, results):
+                anonymized[i] = value
+    elif batch_size:
+        from presidio_analyzer import BatchAnalyzerEngine
+
+        batch_analyzer = BatchAnalyzerEngine(analyzer_engine=analyzer)
+        for start in range(0, len(positions), batch_size):
+            batch = positions[start:start + batch_size]
+            batch_results = batch_analyzer.analyze_iterator(
+                [anonymized[i] for i in batch],
+                language=language,
+                batch_size=batch_size,
+                entities=entities,
+            )
+            for i, results in zip(batch, batch_results):
+                anonymized[i] = _apply_results(anonymized[i], results, anonymizer, operators)
+    else:
+        for i in positions:
+            anonymized[i] = anonymize_text(
+                anonymized[i],
+                analyzer=analyzer,
+                anonymizer=anonymizer,
+                operators=operators,
+                language=language,
+                entities=entities,
+            )
+
+    if cache is not None:
+        cache.put_many((keys[i], anonymized[i]) for i in positions)
+
+    return anonymized
+
+
+def _init_anonymizer_worker(engine_factory, operators, language, batch_size):
+    # Build the engines once per worker process instead of pickling them per task
+    analyzer, anonymizer = engine_factory()
+    _worker_state.update(
+        analyzer=analyzer,
+        anonymizer=anonymizer,
+        operators=operators,
+        language=language,
+        batch_size=batch_size,
+    )
+
+
+def _anonymize_shard(texts: List[str], tier: str = "ner") -> List[str]:
+    return anonymize_texts(
+        texts,
+        tier=tier,
+        analyzer=_worker_state["analyzer"],
+        anonymizer=_worker_state["anonymizer"],
+        operators=_worker_state["operators"],
+        language=_worker_state["language"],
+        batch_size=_worker_state["batch_size"],
+    )
+
+
+def create_anonymizer_pool(
+    workers: int,
+    operators: dict,
+    language: str = "en",
+    batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+    engine_factory=create_presidio_engines,
+):
+    """
+    Process pool for anonymize_texts. Each worker calls engine_factory (a
+    picklable function returning (analyzer, anonymizer)) once at startup.
+    Workers come from process_pool_context, not a fork of this process.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=process_pool_context(),
+        initializer=_init_anonymizer_worker,
+        initargs=(engine_factory, operators, language, batch_size),
+    )
+
+
+def anonymize_dataframe(
+    df: pd.DataFrame,
+    analyzer: AnalyzerEngine,
+    anonymizer: AnonymizerEngine,
+    operators: dict,
+    columns: List[str],
+    batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+    cache: Optional[AnalysisCache] = None,
+    workers: int = 1,
+    engine_factory=create_presidio_engines,
+    detection: Union[str, dict] = "ner",
+) -> pd.DataFrame:
+    """
+    Anonymize the object columns of df listed in columns. Each distinct value
+    of a column is analyzed once, in batches of batch_size (None analyzes
+    one value at a time), and the result is copied to every row holding it.
+    cache optionally carries results across columns, files and runs. The
+    result is the same either way.
+
+    With workers > 1 the distinct values are sharded across a process pool
+    whose workers build their own engines with engine_factory, so it must
+    produce engines configured like analyzer and anonymizer.
+
+    detection is a tier from DETECTION_TIERS for every column, or a dict of
+    column -> tier (columns not listed use "ner"). Structured columns such as
+    emails or phone numbers can use "pattern" to skip the NLP pipeline;
+    "auto" picks "pattern" only when the pattern recognizers match every
+    value of the column entirely (see choose_detection_tier).
+    """
+    if workers > 1:
+        with create_anonymizer_pool(workers, operators, batch_size=batch_size, engine_factory=engine_factory) as executor:
+            return _anonymize_columns(
+                df, analyzer, anonymizer, operators, columns, batch_size, cache, executor, detection, workers
+            )
+    return _anonymize_columns(df, analyzer, anonymizer, operators, columns, batch_size, cache, None, detection)
+
+
+def _anonymize_columns(
+    df, analyzer, anonymizer, operators, columns, batch_size, cache, executor, detection="ner", workers=1
+):
+    df = df.copy()
+
+    for col in columns:
+        if col not in df.columns:
+            continue
+
+        # Only anonymize likely-text columns
+        if df[col].dtype == "object":
+            values = df[col].astype(str)
+            codes, uniques = pd.factorize(values, use_na_sentinel=False)
+            anonymized = anonymize_texts(
+                list(uniques),
+                analyzer=analyzer,
+                anonymizer=anonymizer,
+                operators=operators,
+                batch_size=batch_size,
+                cache=cache,
+                executor=executor,
+                tier=detection.get(col, "ner") if isinstance(detection, dict) else detection,
+                workers=workers,
+            )
+            df[col] = pd.Series(
+                np.asarray(anonymized, dtype=object)[codes],
+                index=values.index,
+                dtype=values.dtype,
+            )
+        else:
+            # If you want to be extra paranoid, cast and run anyway.
+            pass
+
+    return df
+
+
+def anonymize_csv(
+    input_path: str,
+    output_path: str,
+    analyzer: AnalyzerEngine,
+    anonymizer: AnonymizerEngine,
+    operators: dict,
+    columns: List[str],
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+    cache: Optional[AnalysisCache] = None,
+    workers: int = 1,
+    engine_factory=create_presidio_engines,
+    detection: Union[str, dict] = "ner",
+    encoding: str = "utf-8",
+    progress=None,
+) -> dict:
+    """
+    Anonymize columns of a CSV file too large to load at once, chunk_rows
+    rows at a time, appending each chunk to output_path with the input's
+    delimiter. Every cell is read as text, so values outside columns are
+    written back unchanged and columns are anonymized in every chunk.
+    "auto" detection tiers are chosen again for every chunk.
+    progress(rows_done) is called after each chunk.
+    Raises ValueError if a column in columns is not in the header.
+    Returns {"rows", "chunks", "seconds", "rows_per_second"}.
+    """
+    start = time.perf_counter()
+    with open(input_path, "rb") as f:
+        delimiter = detect_delimiter(f)
+
+    stats = {"rows": 0, "chunks": 0}
+    # Write next to the destination and rename, so a failed run never leaves a partial file
+    partial_path = output_path + ".partial"
+    executor = create_anonymizer_pool(
+        workers, operators, batch_size=batch_size, engine_factory=engine_factory
+    ) if workers > 1 else None
+    try:
+        chunks = pd.read_csv(
+            input_path,
+            sep=delimiter,
+            dtype=object,
+            keep_default_na=False,
+            encoding=encoding,
+            chunksize=chunk_rows,
+        )
+        with chunks, open(partial_path, "w", encoding=encoding, newline="") as output_file:
+            for chunk in chunks:
+                if stats["chunks"] == 0:
+                    # A wrong delimiter or header would otherwise skip the columns and copy the PII through
+                    missing = [col for col in columns if col not in chunk.columns]
+                    if missing:
+                        raise ValueError(f"Columns not found in the CSV header: {', '.join(missing)}")
+                chunk = _anonymize_columns(
+                    chunk, analyzer, anonymizer, operators, columns, batch_size, cache, executor, detection, workers
+                )
+                chunk.to_csv(output_file, sep=delimiter, index=False, header=stats["chunks"] == 0)
+
+                stats["rows"] += len(chunk)
+                stats["chunks"] += 1
+                if progress is not None:
+                    progress(stats["rows"])
+        os.replace(partial_path, output_path)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
@@ -0,0 +1,186 @@
+"""
+Disk-backed cache of finished anonymized archives.
+
+Entries are keyed by digests of the uploaded files, the anonymization
+settings and the date (tenure bands depend on it), so an identical export
+processed the same day from any browser session is a hit. Each entry is the archive plus a JSON summary for the preview; the
+least recently used entries are evicted once the cache outgrows max_bytes.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date
+
+# Bump when the output of the pipeline changes, so older entries are not served
+CACHE_VERSION = 2
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "pii_sanitizer_cache")
+DEFAULT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(file):
+    """sha256 of a seekable file object, read in chunks and rewound afterwards."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def cache_key(export_file, hris_file, settings):
+    """Key for one run: the export, the HRIS file and every setting that changes the output."""
+    payload = {
+        "version": CACHE_VERSION,
+        "export": file_digest(export_file),
+        "hris": file_digest(hris_file),
+        "settings": settings,
+        # Timestamps are coarsened in local time
+        "timezone": [time.timezone, time.altzone, list(time.tzname)],
+        # Tenure bands are counted up to today
+        "date": date.today().isoformat(),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Anonymized archives stored as <key>.zip with a <key>.json summary in
+    directory. Lookups refresh an entry's modification time, which is what
+    eviction orders by. max_bytes of 0 disables the cache.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        if max_bytes > 0:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        """
+        Return (archive file opened for reading, summary) for key, or None.
+        The caller closes the file. Opening it here means an entry evicted by
+        another session in the meantime is a miss rather than an error; an
+        open archive stays readable even if it is evicted afterwards.
+        """
+        if self.max_bytes <= 0:
+            return None
+
+        archive_path, summary_path = self._paths(key)
+        archive_file = None
+        try:
+            archive_file = open(archive_path, "rb")
+            with open(summary_path, "r", encoding="utf-8") as f:
+                summary = json.load(f)
+            now = time.time()
+            os.utime(archive_path, (now, now))
+            os.utime(summary_path, (now, now))
+        except (OSError, ValueError):
+            # Missing, half-written or evicted by another session
+            if archive_file is not None:
+                archive_file.close()
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        return archive_file, summary
+
+    def put(self, key, output_file, summary):
+        """Store the archive in output_file (rewound afterwards) and its summary."""
+        if self.max_bytes <= 0:
+            return
+
+        archive_path, summary_path = self._paths(key)
+        output_file.seek(0)
+        partial_paths = []
+        try:
+            # Archive first and summary last: get only serves entries whose summary exists.
+            # Each put writes its own temporary files, so sessions storing the same key
+            # at once never interleave; the last os.replace wins with a complete file.
+            archive_partial = self._partial_path(key, partial_paths)
+            with open(archive_partial, "wb") as f:
+                shutil.copyfileobj(output_file, f, _CHUNK_SIZE)
+            os.replace(archive_partial, archive_path)
+            summary_partial = self._partial_path(key, partial_paths)
+            with open(summary_partial, "w", encoding="utf-8") as f:
+                json.dump(summary, f, separators=(',', ':'))
+            os.replace(summary_partial, summary_path)
+        except OSError:
+            # A full or read-only cache directory only costs the cache
+            for path in partial_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+        finally:
+            output_file.seek(0)
+
+        self._evict()
+
+    def stats(self):
+        """Hit/miss/eviction counts of this process plus the current size of the cache."""
+        entries = self._entries()
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = len(entries)
+        stats["bytes"] = sum(size for _, size, _ in entries)
+        return stats
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".zip", base + ".json"
+
+    def _partial_path(self, key, partial_paths):
+        fd, path = tempfile.mkstemp(prefix=key + ".", suffix=".partial", dir=self.directory)
+        os.close(fd)
+        partial_paths.append(path)
+        return path
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _entries(self):
+        """(last used, size, key) for every complete entry."""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            key = name[:-len(".json")]
+            archive_path, summary_path = self._paths(key)
+            try:
+                archive_stat, summary_stat = os.stat(archive_path), os.stat(summary_path)
+            except OSError:
+                continue
+            entries.append((summary_stat.st_mtime, archive_stat.st_size + summary_stat.st_size, key))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            evicted += 1
+        if evicted:
+            self._count("evictions", evicted)
@@ -0,0 +1,188 @@
+"""
+Synthetic Slack exports and matching HRIS files at configurable scale, for
+benchmarks. Everything is generated locally from a seed, so runs are
+reproducible and need no network or real data.
+"""
+import csv
+import json
+import random
+import time
+from zipfile import ZIP_DEFLATED, ZipFile
+
+ROLES = ["Engineer", "Senior Engineer", "Manager", "Designer", "Analyst", "Sales Rep", "Support", "Director"]
+TEAMS = ["Backend", "Frontend", "Platform", "Data", "Sales", "Support", "Marketing", "Finance", "People", "Design"]
+LOCATIONS = ["Office", "Remote", "Hybrid"]
+STATUSES = ["Active", "Active", "Active", "Terminated"]
+EMPLOYMENT_TYPES = ["Full_Time", "Full_Time", "Part_Time", "Contractor"]
+
+FIRST_NAMES = ["Emma", "Liam", "Olivia", "Noah", "Ava", "Elijah", "Sofia", "Lucas", "Mia", "Mateo", "Aisha", "Kenji"]
+LAST_NAMES = ["Wilson", "Garcia", "Smith", "Nguyen", "Okafor", "Kowalski", "Tanaka", "Silva", "Brown", "Haddad"]
+CITIES = ["Paris", "Berlin", "Toronto", "Austin", "Lagos", "Osaka", "Lisbon"]
+
+# Messages start here (2023-11-14) and each day file covers one day
+START_TS = 1700000000
+SECONDS_PER_DAY = 86400
+MESSAGES_PER_DAY_FILE = 50
+
+
+def _user_id(i):
+    return f"U{i:08d}"
+
+
+def generate_slack_export(
+    export_path,
+    hris_path,
+    users=1000,
+    channels=200,
+    messages=100_000,
+    dms=None,
+    bots=5,
+    thread_rate=0.1,
+    reaction_rate=0.2,
+    edit_rate=0.05,
+    seed=0,
+):
+    """
+    Write a Slack export ZIP to export_path and the matching HRIS CSV to
+    hris_path. messages are spread over channels plus dms direct messages
+    (default: channels // 2), MESSAGES_PER_DAY_FILE per day file, with
+    threads, reactions and edits at the given rates. Returns the counts
+    actually written.
+    """
+    rng = random.Random(seed)
+    dms = channels // 2 if dms is None else dms
+
+    user_ids = [_user_id(i) for i in range(users)]
+    bot_ids = [f"B{i:08d}" for i in range(bots)]
+
+    with open(hris_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Email", "Role", "Team", "Work_Location", "Date_of_Hire", "Employment_Status", "Employment_Type"])
+        for i in range(users):
+            writer.writerow([
+                f"user{i}@example.com",
+                rng.choice(ROLES),
+                rng.choice(TEAMS),
+                rng.choice(LOCATIONS),
+                f"{rng.randint(2012, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                rng.choice(STATUSES),
+                rng.choice(EMPLOYMENT_TYPES),
+            ])
+
+    slack_users = [
+        {"id": user_id, "name": f"user{i}", "tz_label": "Pacific Standard Time", "profile": {"email": f"user{i}@example.com"}}
+        for i, user_id in enumerate(user_ids)
+    ] + [
+        {"id": bot_id, "name": f"bot{i}", "is_bot": True, "profile": {"bot_id": bot_id}}
+        for i, bot_id in enumerate(bot_ids)
+    ]
+    channel_list = [
+        {
+            "id": f"C{i:08d}",
+            "name": f"channel-{i}",
+            "created": START_TS - SECONDS_PER_DAY,
+            "creator": rng.choice(user_ids),
+            "is_archived": rng.random() < 0.1,
+            "members": rng.sample(user_ids, min(users, rng.randint(2, 50))),
+        }
+        for i in range(channels)
+    ]
+    dm_list = [{"id": f"D{i:08d}", "members": rng.sample(user_ids, 2)} for i in range(dms)]
+
+    conversations = [(channel["name"], channel["members"]) for channel in channel_list]
+    conversations += [(dm["id"], dm["members"]) for dm in dm_list]
+    authors = user_ids + bot_ids
+
+    written = {"users": users, "bots": bots, "channels": channels, "dms": dms, "messages": 0, "day_files": 0}
+    with ZipFile(export_path, "w", compression=ZIP_DEFLATED) as zf:
+        zf.writestr("users.json", json.dumps(slack_users))
+        zf.writestr("channels.json", json.dumps(channel_list))
+        zf.writestr("dms.json", json.dumps(dm_list))
+
+        # Round-robin over conversations so every one gets a share of the messages
+        day = 0
+        while written["messages"] < messages:
+            for folder, members in conversations:
+                count = min(MESSAGES_PER_DAY_FILE, messages - written["messages"])
+                if count <= 0:
+                    break
+                day_start = START_TS + day * SECONDS_PER_DAY
+                day_messages = [
+                    _synthetic_message(rng, day_start + j * (SECONDS_PER_DAY // (count + 1)), members, authors,
+                                       thread_rate, reaction_rate, edit_rate)
+                    for j in range(count)
+                ]
+                date = _date_string(day_start)
+                zf.writestr(f"{folder}/{date}.json", json.dumps(day_messages))
+                written["messages"] += count
+                written["day_files"] += 1
+            day += 1
+
+    return written
+
+
+def _synthetic_message(rng, second, members, authors, thread_rate, reaction_rate, edit_rate):
+    ts = f"{second}.{rng.randint(0, 999999):06d}"
+    author = rng.choice(members) if rng.random() < 0.97 else rng.choice(authors)
+    msg = {
+        "type": "message",
+        "user": author,
+        "ts": ts,
+        "text": f"Message from {rng.choice(FIRST_NAMES)} about {rng.choice(CITIES)}",
+        "user_profile": {"real_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"},
+    }
+    if rng.random() < thread_rate:
+        repliers = rng.sample(members, min(len(members), rng.randint(1, 4)))
+        msg["thread_ts"] = ts
+        msg["reply_count"] = len(repliers)
+        msg["reply_users_count"] = len(repliers)
+        msg["reply_users"] = repliers
+        msg["latest_reply"] = f"{second + 600}.000100"
+        msg["replies"] = [{"user": user, "ts": f"{second + 60 * (k + 1)}.000100"} for k, user in enumerate(repliers)]
+    if rng.random() < reaction_rate:
+        reactors = rng.sample(members, min(len(members), rng.randint(1, 5)))
+        msg["reactions"] = [{"name": "thumbsup", "count": len(reactors), "users": reactors}]
+    if rng.random() < edit_rate:
+        msg["edited"] = {"user": author, "ts": f"{second + 30}.000000"}
+    return msg
+
+
+def _date_string(second):
+    return time.strftime("%Y-%m-%d", time.gmtime(second))
+
+
+def generate_notes_csv(path, rows=20_000, distinct=2_000, seed=0):
+    """
+    Write an HR/ticketing style CSV with free-text and structured PII columns.
+    Values repeat across rows (about distinct different notes), as in real files.
+    """
+    rng = random.Random(seed)
+    templates = [
+        "{name} from {city} asked about payroll, call {phone}",
+        "Ticket closed by {name}",
+        "Forwarded to {email} for review",
+        "Standard onboarding checklist completed",
+        "{name} relocated to {city}",
+        "Login from {ip} flagged for {name}",
+    ]
+    notes = []
+    for _ in range(distinct):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        notes.append(rng.choice(templates).format(
+            name=name,
+            city=rng.choice(CITIES),
+            phone=f"212-555-{rng.randint(0, 9999):04d}",
+            email=f"{name.split()[0].lower()}@example.com",
+            ip=f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+        ))
+
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["ticket_id", "email", "phone", "note"])
+        for i in range(rows):
+            writer.writerow([
+                i,
+                f"user{rng.randint(0, distinct)}@example.com",
+                f"+1 212-555-{rng.randint(0, 9999):04d}",
+                rng.choice(notes),
+            ])
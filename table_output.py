@@ -0,0 +1,229 @@
+"""
+Columnar output formats: the anonymized users, conversations and messages as
+three tables (one row per message, with the conversation ID and date as
+columns) instead of one JSON file per conversation and day.
+
+Parquet is written with pyarrow when it is installed; NDJSON (one JSON
+object per line) needs nothing beyond the standard library.
+"""
+import json
+import math
+import shutil
+import tempfile
+
+OUTPUT_FORMATS = ("json", "parquet", "ndjson")
+DEFAULT_OUTPUT_FORMAT = "json"
+
+# Messages buffered before they are written to Parquet as one row group
+PARQUET_ROW_GROUP_ROWS = 50_000
+
+# Message table columns, in order
+MESSAGE_COLUMNS = (
+    "conversation_id", "date", "user", "ts", "edited_ts", "edited_user", "thread_ts", "latest_reply",
+    "reply_count", "reply_users_count", "reply_users", "replies", "reactions", "last_read", "irregular",
+)
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def available_output_formats():
+    """OUTPUT_FORMATS that can be written here: parquet only when pyarrow is installed."""
+    return tuple(fmt for fmt in OUTPUT_FORMATS if fmt != "parquet" or parquet_available())
+
+
+def check_output_format(output_format):
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format '{output_format}'. Choose one of: {', '.join(OUTPUT_FORMATS)}")
+    if output_format == "parquet" and not parquet_available():
+        raise ValueError("Parquet output needs pyarrow, which is not installed. Use the 'ndjson' format instead.")
+
+
+def _text(value):
+    # Timestamps that could not be rounded are kept in their original form, as JSON text
+    if value is None or type(value) is str:
+        return value
+    return json.dumps(value)
+
+
+def _count(value, irregular, key):
+    if value is None or type(value) is int:
+        return value
+    # Not an integer (e.g. "3" in a hand-edited export): kept in the irregular column
+    irregular[key] = value
+    return None
+
+
+def message_row(conv_id, date, msg):
+    """
+    Flatten one anonymized message into a row of the message table. Values
+    that do not fit their typed column are kept as a JSON object in
+    "irregular", so nothing the JSON output has is lost.
+    """
+    edited = msg.get("edited") or {}
+    irregular = {}
+    row = {
+        "conversation_id": conv_id,
+        "date": date,
+        "user": msg.get("user"),
+        "ts": _text(msg.get("ts")),
+        "edited_ts": _text(edited.get("ts")),
+        "edited_user": edited.get("user"),
+        "thread_ts": _text(msg.get("thread_ts")),
+        "latest_reply": _text(msg.get("latest_reply")),
+        "reply_count": _count(msg.get("reply_count"), irregular, "reply_count"),
+        "reply_users_count": _count(msg.get("reply_users_count"), irregular, "reply_users_count"),
+        "reply_users": msg.get("reply_users"),
+        "replies": [{"user": reply["user"], "ts": _text(reply["ts"])} for reply in msg["replies"]]
+        if msg.get("replies") else None,
+        "reactions": msg.get("reactions"),
+        "last_read": _text(msg.get("last_read")),
+    }
+    row["irregular"] = json.dumps(irregular) if irregular else None
+    return row
+
+
+def _message_schema():
+    import pyarrow as pa
+
+    string = pa.string()
+    return pa.schema([
+        ("conversation_id", string),
+        ("date", string),
+        ("user", string),
+        ("ts", string),
+        ("edited_ts", string),
+        ("edited_user", string),
+        ("thread_ts", string),
+        ("latest_reply", string),
+        ("reply_count", pa.int64()),
+        ("reply_users_count", pa.int64()),
+        ("reply_users", pa.list_(string)),
+        ("replies", pa.list_(pa.struct([("user", string), ("ts", string)]))),
+        ("reactions", pa.list_(pa.struct([("count", pa.int64()), ("users", pa.list_(string))]))),
+        ("last_read", string),
+        ("irregular", string),
+    ])
+
+
+def _cell(value):
+    # HRIS columns read by pandas hold NaN for missing values
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _rows_to_table(rows, columns=None):
+    """
+    pyarrow Table of dict rows; a column with mixed value types is written as
+    strings. columns fixes the column order, and keeps the columns of an empty table.
+    """
+    import pyarrow as pa
+
+    if columns is None:
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+    data = {}
+    for column in columns:
+        values = [_cell(row.get(column)) for row in rows]
+        if len({type(value) for value in values if value is not None}) > 1:
+            values = [None if value is None else str(value) for value in values]
+        data[column] = values
+    return pa.table(data)
+
+
+class TableWriter:
+    """
+    Write users, conversations and messages into an ArchiveWriter as
+    <table>.parquet or <table>.ndjson. Messages are added one day file at a
+    time and streamed out, so memory stays bounded by a Parquet row group.
+    """
+
+    def __init__(self, zipf, output_format):
+        check_output_format(output_format)
+        if output_format == "json":
+            raise ValueError("TableWriter writes the parquet and ndjson formats only.")
+        self._zipf = zipf
+        self._format = output_format
+        self._messages = None  # open archive entry (ndjson) or temporary file (parquet)
+        self._parquet_writer = None
+        self._buffer = []
+        self.message_rows = 0
+
+    def write_table(self, name, rows, columns=None):
+        """Write a small table (users, conversations, aggregates) in one go."""
+        if self._format == "ndjson":
+            self._zipf.writestr(f"{name}.ndjson", "".join(json.dumps(row, separators=(',', ':')) + "\n" for row in rows))
+            return
+
+        import pyarrow.parquet as pq
+
+        with tempfile.TemporaryFile() as f:
+            pq.write_table(_rows_to_table(rows, columns), f)
+            f.seek(0)
+            self._zipf.writestr(f"{name}.parquet", f.read())
+
+    def add_messages(self, conv_id, date, msgs):
+        rows = [message_row(conv_id, date, msg) for msg in msgs]
+        self.message_rows += len(rows)
+
+        if self._format == "ndjson":
+            if self._messages is None:
+                self._messages = self._zipf.open_entry("messages.ndjson")
+            self._messages.write("".join(json.dumps(row, separators=(',', ':')) + "\n" for row in rows).encode("utf-8"))
+            return
+
+        self._buffer.extend(rows)
+        if len(self._buffer) >= PARQUET_ROW_GROUP_ROWS:
+            self._flush_parquet()
+
+    def close(self):
+        """Finish the messages table and add it to the archive."""
+        if self._format == "ndjson":
+            if self._messages is None:
+                self._messages = self._zipf.open_entry("messages.ndjson")
+            self._messages.close()
+            self._messages = None
+            return
+
+        self._flush_parquet(final=True)
+        self._parquet_writer.close()
+        self._messages.seek(0)
+        with self._zipf.open_entry("messages.parquet") as entry:
+            shutil.copyfileobj(self._messages, entry)
+        self._discard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._discard()
+
+    def _flush_parquet(self, final=False):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._buffer and not final:
+            return
+        if self._parquet_writer is None:
+            # Row groups go to a temporary file, copied into the archive on close
+            self._messages = tempfile.TemporaryFile()
+            self._parquet_writer = pq.ParquetWriter(self._messages, _message_schema())
+        if self._buffer:
+            columns = {column: [row[column] for row in self._buffer] for column in MESSAGE_COLUMNS}
+            self._parquet_writer.write_table(pa.Table.from_pydict(columns, schema=self._parquet_writer.schema))
+            self._buffer = []
+
+    def _discard(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        if self._messages is not None:
+            self._messages.close()
+            self._messages = None
+        self._buffer = []
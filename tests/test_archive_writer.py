@@ -0,0 +1,69 @@
+import io
+from zipfile import ZipFile
+
+import pytest
+
+import archive_writer
+from archive_writer import COMPRESSION_METHODS, ArchiveWriter
+
+ENTRIES = {
+    f"messages/C{i}/2024-01-{i + 1:02d}.json": b'[{"user": "E1", "ts": "1700000000"}]' * (i + 1)
+    for i in range(12)
+}
+STREAMED = b'{"user":"E1"}\n' * 1000
+COPIED = b'[{"Clarity_ID": "E1"}]' * 50
+
+
+def previous_archive(compression):
+    source = io.BytesIO()
+    with ArchiveWriter(source, compression=compression) as zipf:
+        zipf.writestr("users.json", COPIED)
+    source.seek(0)
+    return source
+
+
+def write_archive(compression, threads, source_compression=None):
+    """Archive with written, copied and streamed entries."""
+    output = io.BytesIO()
+    with ArchiveWriter(output, compression=compression, level=6, threads=threads) as zipf:
+        for name, data in ENTRIES.items():
+            zipf.writestr(name, data)
+        with ZipFile(previous_archive(source_compression or compression)) as source:
+            zipf.copy_entry(source, "users.json")
+        with zipf.open_entry("messages.ndjson") as entry:
+            entry.write(STREAMED)
+    output.seek(0)
+    return output
+
+
+def check_archive(output):
+    with ZipFile(output) as zipf:
+        assert zipf.testzip() is None
+        for name, data in ENTRIES.items():
+            assert zipf.read(name) == data
+        assert zipf.read("users.json") == COPIED
+        assert zipf.read("messages.ndjson") == STREAMED
+
+
+@pytest.mark.parametrize("compression", list(COMPRESSION_METHODS))
+@pytest.mark.parametrize("threads", [1, 3])
+def test_round_trip(compression, threads):
+    check_archive(write_archive(compression, threads))
+
+
+@pytest.mark.parametrize("compression", list(COMPRESSION_METHODS))
+@pytest.mark.parametrize("source_compression", list(COMPRESSION_METHODS))
+def test_copy_entry_between_compressions(compression, source_compression):
+    check_archive(write_archive(compression, threads=2, source_compression=source_compression))
+
+
+@pytest.mark.parametrize("compression", list(COMPRESSION_METHODS))
+def test_fallback_without_zipfile_internals(compression, monkeypatch):
+    monkeypatch.setattr(archive_writer, "raw_writes_supported", lambda zipf, compress_type: False)
+    check_archive(write_archive(compression, threads=3))
+
+
+def test_raw_writes_supported_here():
+    with ZipFile(io.BytesIO(), "w") as zipf:
+        for compress_type in COMPRESSION_METHODS.values():
+            assert archive_writer.raw_writes_supported(zipf, compress_type)
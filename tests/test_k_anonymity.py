@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from k_anonymity import SUPPRESSED_VALUE, apply_k_anonymity, enforce_k_anonymity
+
+
+def reference_k_anonymity(df, column, k=5):
+    """The row-wise rule enforce_k_anonymity replaced."""
+    df = df.copy()
+    df[column] = df[column].fillna(SUPPRESSED_VALUE)
+    df[column] = df[column].apply(lambda x: SUPPRESSED_VALUE if x == "" or pd.isna(x) else x)
+    counts = df[column].value_counts()
+    df[column] = df[column].apply(lambda x: SUPPRESSED_VALUE if counts.get(x, 0) < k else x)
+    others = (df[column] == SUPPRESSED_VALUE).sum()
+    if 0 < others < k:
+        df[column] = SUPPRESSED_VALUE
+    return df
+
+
+def test_four_row_band_suppresses_the_column():
+    # The 4-row band becomes "Others", which then has fewer than k rows itself
+    df = pd.DataFrame({"Tenure_Band": ["1-2yr"] * 10 + ["5+yr"] * 4})
+    result = enforce_k_anonymity(df, ["Tenure_Band"], k=5)
+    assert (result["Tenure_Band"] == SUPPRESSED_VALUE).all()
+
+
+def test_four_row_band_joins_other_suppressed_rows():
+    # With one missing value "Others" reaches k rows, so the common band is kept
+    df = pd.DataFrame({"Tenure_Band": ["1-2yr"] * 10 + ["5+yr"] * 4 + [None]})
+    result = enforce_k_anonymity(df, ["Tenure_Band"], k=5)
+    assert result["Tenure_Band"].tolist() == ["1-2yr"] * 10 + [SUPPRESSED_VALUE] * 5
+
+
+def test_input_is_not_modified():
+    df = pd.DataFrame({"Team": ["A"] * 5 + ["B"]})
+    enforce_k_anonymity(df, ["Team"], k=5)
+    assert df["Team"].tolist() == ["A"] * 5 + ["B"]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_row_wise_rule(seed):
+    rng = np.random.default_rng(seed)
+    choices = np.array(["A", "B", "C", "D", "", None, np.nan, 3], dtype=object)
+    df = pd.DataFrame({"Role": rng.choice(choices, size=int(rng.integers(1, 40)), p=[.4, .2, .1, .1, .05, .05, .05, .05])})
+    k = int(rng.integers(1, 8))
+    expected = reference_k_anonymity(df, "Role", k=k)["Role"].astype(object)
+    assert apply_k_anonymity(df, "Role", k=k)["Role"].tolist() == expected.tolist()
+
+
+def test_rare_combinations():
+    # Every value is common on its own, but ("A", "Y") and ("B", "X") occur 3 times each
+    df = pd.DataFrame({"Team": ["A"] * 10 + ["B"] * 10, "Role": ["X"] * 7 + ["Y"] * 3 + ["X"] * 3 + ["Y"] * 7})
+    rare = ((df["Team"] == "A") & (df["Role"] == "Y")) | ((df["Team"] == "B") & (df["Role"] == "X"))
+
+    result = enforce_k_anonymity(df, ["Team", "Role"], k=5, combinations=[("Team", "Role")])
+    assert (result.loc[rare, ["Team", "Role"]] == SUPPRESSED_VALUE).all().all()
+    assert result.loc[~rare, ["Team", "Role"]].values.tolist() == df.loc[~rare, ["Team", "Role"]].values.tolist()
+
+    # 6 suppressed rows are still fewer than k=7, so both columns are suppressed
+    result = enforce_k_anonymity(df, ["Team", "Role"], k=7, combinations=[("Team", "Role")])
+    assert (result[["Team", "Role"]] == SUPPRESSED_VALUE).all().all()
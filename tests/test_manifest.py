@@ -0,0 +1,123 @@
+import io
+import json
+from zipfile import ZipFile
+
+import pytest
+
+from manifest import new_manifest, reusable_entries
+from pipeline import build_employee_hashes, build_translation_context, combine_data, stream_anonymized_export
+from processing_report import REPORT_NAME
+
+USERS = [{"id": f"U{i}", "name": f"u{i}", "profile": {"email": f"user{i}@example.com"}} for i in range(6)]
+HRIS = "Email,Role,Team\n" + "".join(f"user{i}@example.com,Eng,A\n" for i in range(6))
+CHANNELS = [{"id": "C1", "name": "general", "created": 1600000000, "members": ["U0", "U1", "U2"]}]
+
+
+def day(first_ts, count):
+    return [{"user": f"U{i % 6}", "ts": f"{first_ts + i * 61}.000100", "text": "hi"} for i in range(count)]
+
+
+DAYS = {f"general/2024-01-0{d}.json": day(1704067200 + d * 86400, 3 + d) for d in range(1, 5)}
+
+
+def export(days, users=USERS):
+    buffer = io.BytesIO()
+    with ZipFile(buffer, "w") as zipf:
+        zipf.writestr("users.json", json.dumps(users))
+        zipf.writestr("channels.json", json.dumps(CHANNELS))
+        for name, msgs in days.items():
+            zipf.writestr(name, json.dumps(msgs))
+    return buffer.getvalue()
+
+
+def run(days, previous_archive=None, previous_manifest=None, users=USERS, hris=HRIS):
+    data = export(days, users)
+    employee_data, bots = combine_data(io.BytesIO(hris.encode()), io.BytesIO(data), k=1)
+    output = io.BytesIO()
+    summary = stream_anonymized_export(
+        io.BytesIO(data), employee_data, bots, output,
+        previous_archive=previous_archive, previous_manifest=previous_manifest,
+    )
+    output.seek(0)
+    return summary, output
+
+
+def contents(archive):
+    with ZipFile(archive) as zipf:
+        return {name: zipf.read(name) for name in zipf.namelist() if name != REPORT_NAME}
+
+
+def test_unchanged_day_files_are_reused():
+    first, first_archive = run(DAYS)
+    assert first["reused_day_files"] == 0
+
+    # A cumulative export: one day file gained a message and a new day was added
+    days = dict(DAYS)
+    days["general/2024-01-02.json"] = DAYS["general/2024-01-02.json"] + day(1704240000, 1)
+    days["general/2024-01-05.json"] = day(1704499200, 2)
+
+    second, second_archive = run(days, first_archive, first["manifest"])
+    assert second["reused_day_files"] == 3
+    assert second["day_file_count"] == 5
+
+    full, full_archive = run(days)
+    assert contents(second_archive) == contents(full_archive)
+    assert second["manifest"] == full["manifest"]
+    assert second["message_count"] == full["message_count"]
+
+
+def test_newly_mapped_user_reprocesses_day_files_that_left_them_out():
+    # U5 writes in the last two days and only reacts on the second
+    days = dict(DAYS)
+    days["general/2024-01-02.json"] = [
+        dict(msg, reactions=[{"name": "+1", "count": 1, "users": ["U5"]}]) for msg in DAYS["general/2024-01-02.json"]
+    ]
+    # e.g. a shared-channel user, in neither users.json nor the HRIS file at first
+    users, hris = USERS[:5], "".join(HRIS.splitlines(keepends=True)[:6])
+    first, first_archive = run(days, users=users, hris=hris)
+    assert [entry["unmapped"] for _, entry in sorted(first["manifest"]["entries"].items())] == [False, True, True, True]
+
+    second, second_archive = run(days, first_archive, first["manifest"])
+    full, full_archive = run(days)
+    assert second["reused_day_files"] == 1
+    assert second["message_count"] == full["message_count"] > first["message_count"]
+    assert contents(second_archive) == contents(full_archive)
+    assert second["manifest"] == full["manifest"]
+
+
+def test_changed_crc_is_not_reused():
+    first, first_archive = run(DAYS)
+    manifest = json.loads(json.dumps(first["manifest"]))
+    manifest["entries"][min(manifest["entries"])]["crc"] ^= 1
+
+    second, _ = run(DAYS, first_archive, manifest)
+    assert second["reused_day_files"] == len(DAYS) - 1
+
+
+@pytest.fixture
+def manifests():
+    hashes = build_employee_hashes(combine_data(io.BytesIO(HRIS.encode()), io.BytesIO(export(DAYS)), k=1)[0])
+    context = build_translation_context(hashes, [])
+    previous = new_manifest(context)
+    previous["entries"]["C/2024-01-01"] = {"crc": 1, "size": 2, "messages": 3, "unmapped": False}
+    previous["entries"]["C/2024-01-02"] = {"crc": 4, "size": 5, "messages": 6, "unmapped": True}
+    return previous, context
+
+
+def test_reusable_entries(manifests):
+    previous, context = manifests
+    assert reusable_entries(previous, new_manifest(context)) == previous["entries"]
+    assert reusable_entries(previous, new_manifest(context, compact=True)) == {}
+    assert reusable_entries(previous, new_manifest(context, output_format="ndjson")) == {}
+    assert reusable_entries(None, new_manifest(context)) == {}
+    assert reusable_entries(dict(previous, version=0), new_manifest(context)) == {}
+
+
+def test_mapped_users_may_only_be_added(manifests):
+    previous, context = manifests
+    current = new_manifest(context)
+    # Day files that left out unmapped users are reprocessed once someone new is mapped
+    assert reusable_entries(previous, dict(current, mapped=current["mapped"] + ["ENEW"])) == {
+        "C/2024-01-01": previous["entries"]["C/2024-01-01"],
+    }
+    assert reusable_entries(previous, dict(current, mapped=current["mapped"][1:])) == {}
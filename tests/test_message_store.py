@@ -0,0 +1,67 @@
+import json
+
+from message_store import MessageStore
+
+MESSAGES = [
+    {"user": "E1", "ts": "1700000040"},
+    {
+        "user": "E2", "ts": "1700000100", "edited": {"ts": "1700000160", "user": "E1"},
+        "thread_ts": "1700000100", "latest_reply": "1700000400", "reply_count": 2,
+        "reply_users_count": 2, "reply_users": ["E1", "E3"],
+        "replies": [{"user": "E1", "ts": "1700000220"}, {"user": "E3", "ts": "1700000400"}],
+        "reactions": [{"count": 2, "users": ["E1", "E3"]}],
+        "last_read": "1700000400.000100",
+    },
+    # Values kept as they were in the export
+    {"user": "E1", "ts": "garbage", "thread_ts": "1700000100.5", "reply_count": "3", "reply_users_count": 1.5},
+    {"user": "E2", "ts": str(2 ** 63), "latest_reply": 1700000400, "reply_count": 2 ** 63, "text": "héllo"},
+]
+
+
+def same(stored, messages):
+    # Compares types and key order too, as the day files are serialized from the store
+    return json.dumps(stored) == json.dumps(messages)
+
+
+def test_round_trip():
+    store = MessageStore()
+    days = [("C1", "2024-01-01", MESSAGES[:2]), ("C1", "2024-01-02", MESSAGES[2:]), ("D1", "2024-01-01", MESSAGES)]
+    for conv_id, date, messages in days:
+        store.append_day(conv_id, date, messages)
+
+    stored = list(store.iter_days())
+    assert [(conv_id, date) for conv_id, date, _ in stored] == [(conv_id, date) for conv_id, date, _ in days]
+    for (_, _, messages), (_, _, stored_messages) in zip(days, stored):
+        assert same(stored_messages, messages)
+    assert store.message_count == len(store) == 8
+
+
+def test_day_added_in_parts():
+    store = MessageStore()
+    store.append_day("C1", "2024-01-01", MESSAGES[:1])
+    store.append_day("C1", "2024-01-02", MESSAGES[2:])
+    store.append_day("C1", "2024-01-01", MESSAGES[1:2])
+    store.append_day("C1", "2024-01-03", [])
+
+    days = list(store.iter_days())
+    assert [date for _, date, _ in days] == ["2024-01-01", "2024-01-02"]
+    assert same(days[0][2], MESSAGES[:2])
+
+
+def test_read_messages_are_copies():
+    store = MessageStore()
+    messages = json.loads(json.dumps(MESSAGES))
+    store.append_day("C1", "2024-01-01", messages)
+    messages[1]["reply_users"].append("E9")
+
+    (_, _, stored), = store.iter_days()
+    stored[1]["reply_users"].append("E8")
+    stored.append({"user": "E7"})
+    (_, _, stored_again), = store.iter_days()
+    assert same(stored_again, MESSAGES)
+
+
+def test_empty_store():
+    store = MessageStore()
+    assert store.message_count == 0
+    assert list(store.iter_days()) == []
@@ -0,0 +1,123 @@
+import csv
+import io
+
+import pandas as pd
+import pytest
+
+from pipeline import detect_delimiter
+
+pytest.importorskip("presidio_analyzer")
+
+from presidio_setup import DEFAULT_OPERATORS, SPACY_MODELS, create_presidio_engines  # noqa: E402
+from processors import anonymize_csv, anonymize_dataframe, choose_detection_tier  # noqa: E402
+
+ROWS = [
+    ["ticket_id", "email", "note"],
+    ["1", "ann@example.com", "Call 212-555-0101, then close"],
+    ["2", "bob@example.com", "Forwarded to ann@example.com, see thread"],
+]
+
+
+@pytest.fixture(scope="module")
+def engines():
+    # Pattern recognizers only, so no spaCy model is needed
+    return create_presidio_engines(None)
+
+
+def write_crlf_csv(path):
+    # csv.writer ends lines with CRLF by default
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(ROWS)
+
+
+def test_detect_delimiter_crlf_with_quoted_commas(tmp_path):
+    path = tmp_path / "notes.csv"
+    write_crlf_csv(path)
+    with open(path, "rb") as f:
+        assert detect_delimiter(f) == ","
+
+
+@pytest.mark.parametrize("sample, delimiter", [(b"a;b\n1;2\n", ";"), (b"a\tb\n1\t2\n", "\t"), (b"a|b\n1|2\n", "|")])
+def test_detect_delimiter(sample, delimiter):
+    assert detect_delimiter(io.BytesIO(sample)) == delimiter
+
+
+def test_anonymize_csv_crlf_with_quoted_commas(tmp_path, engines):
+    input_path, output_path = tmp_path / "notes.csv", tmp_path / "anonymized.csv"
+    write_crlf_csv(input_path)
+    analyzer, anonymizer = engines
+
+    stats = anonymize_csv(
+        str(input_path), str(output_path), analyzer, anonymizer, DEFAULT_OPERATORS, ["email", "note"],
+        detection="pattern",
+    )
+
+    with open(output_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert stats["rows"] == 2
+    assert rows[0] == ROWS[0]
+    assert [row[0] for row in rows[1:]] == ["1", "2"]
+    assert "example.com" not in output_path.read_text(encoding="utf-8")
+    assert "212-555-0101" not in output_path.read_text(encoding="utf-8")
+
+
+def test_anonymize_csv_missing_column(tmp_path, engines):
+    input_path, output_path = tmp_path / "notes.csv", tmp_path / "anonymized.csv"
+    write_crlf_csv(input_path)
+    analyzer, anonymizer = engines
+
+    with pytest.raises(ValueError, match="comment"):
+        anonymize_csv(
+            str(input_path), str(output_path), analyzer, anonymizer, DEFAULT_OPERATORS, ["email", "comment"],
+            detection="pattern",
+        )
+    assert not output_path.exists()
+
+
+# Mostly clean notes with two rare names, which only NER can find
+NOTES = [f"Ticket {i} resolved, no follow-up needed" for i in range(2050)] + ["Alice escalated", "ask Bob Smith"]
+
+
+@pytest.mark.parametrize("texts, tier", [
+    (["ann@example.com", "bob@example.com"], "pattern"),
+    (["+1 212-555-0101", "  212 555 0199 "], "pattern"),
+    (["ann@example.com", "ask Bob Smith"], "ner"),
+    (["Forwarded to ann@example.com"], "ner"),
+    (NOTES, "ner"),
+])
+def test_choose_detection_tier(engines, texts, tier):
+    analyzer, _ = engines
+    assert choose_detection_tier(texts, analyzer, DEFAULT_OPERATORS) == tier
+
+
+def test_auto_detection_masks_rare_names():
+    spacy = pytest.importorskip("spacy")
+    if not spacy.util.is_package(SPACY_MODELS["sm"]):
+        pytest.skip("spaCy model not installed")
+    analyzer, anonymizer = create_presidio_engines("sm")
+    df = pd.DataFrame({"note": NOTES})
+
+    result = anonymize_dataframe(df, analyzer, anonymizer, DEFAULT_OPERATORS, ["note"], detection="auto")
+    expected = anonymize_dataframe(df, analyzer, anonymizer, DEFAULT_OPERATORS, ["note"], detection="ner")
+    assert result["note"].tolist() == expected["note"].tolist()
+    assert not any("Alice" in note or "Bob" in note for note in result["note"])
+
+
+def test_anonymize_csv_chooses_auto_tier_per_chunk(tmp_path, engines, monkeypatch):
+    import processors
+
+    input_path, output_path = tmp_path / "contacts.csv", tmp_path / "anonymized.csv"
+    input_path.write_text("contact\nann@example.com\nbob@example.com\nask Bob Smith\n", encoding="utf-8")
+    analyzer, anonymizer = engines
+    tiers = []
+
+    def choose(*args, **kwargs):
+        tiers.append(choose_detection_tier(*args, **kwargs))
+        return tiers[-1]
+
+    monkeypatch.setattr(processors, "choose_detection_tier", choose)
+    anonymize_csv(
+        str(input_path), str(output_path), analyzer, anonymizer, DEFAULT_OPERATORS, ["contact"],
+        chunk_rows=2, detection="auto",
+    )
+    assert tiers == ["pattern", "ner"]
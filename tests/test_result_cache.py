@@ -0,0 +1,74 @@
+import io
+import os
+import threading
+from datetime import date
+
+import result_cache
+from result_cache import ResultCache, cache_key
+
+
+def test_get_returns_open_archive(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1024 * 1024)
+    cache.put("key", io.BytesIO(b"archive"), {"message_count": 3})
+
+    archive_file, summary = cache.get("key")
+    with archive_file:
+        assert archive_file.read() == b"archive"
+    assert summary == {"message_count": 3}
+
+
+def test_entry_evicted_before_get_is_a_miss(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1024 * 1024)
+    cache.put("key", io.BytesIO(b"archive"), {"message_count": 3})
+    # Another session evicted the archive but its summary is still there
+    os.remove(tmp_path / "key.zip")
+
+    assert cache.get("key") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_archive_stays_readable_after_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1024 * 1024)
+    cache.put("key", io.BytesIO(b"archive"), {})
+
+    archive_file, _ = cache.get("key")
+    with archive_file:
+        for name in ("key.zip", "key.json"):
+            try:
+                os.remove(tmp_path / name)
+            except PermissionError:
+                # Windows does not delete open files; eviction skips them
+                pass
+        assert archive_file.read() == b"archive"
+
+
+def test_concurrent_puts_of_the_same_key(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=64 * 1024 * 1024)
+    archives = [bytes([i]) * (4 * 1024 * 1024) for i in range(4)]
+    threads = [
+        threading.Thread(target=cache.put, args=("key", io.BytesIO(archive), {"writer": i}))
+        for i, archive in enumerate(archives)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    archive_file, summary = cache.get("key")
+    with archive_file:
+        assert archive_file.read() in archives
+    assert sorted(os.listdir(tmp_path)) == ["key.json", "key.zip"]
+
+
+def test_cache_key_changes_with_the_date(monkeypatch):
+    files = io.BytesIO(b"export"), io.BytesIO(b"hris")
+    today = cache_key(*files, {"k": 5})
+    assert cache_key(*files, {"k": 5}) == today
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return date.fromordinal(date.today().toordinal() + 1)
+
+    monkeypatch.setattr(result_cache, "date", Tomorrow)
+    assert cache_key(*files, {"k": 5}) != today
@@ -0,0 +1,47 @@
+import io
+import json
+from zipfile import ZipFile
+
+import pytest
+
+from archive_writer import ArchiveWriter
+from table_output import MESSAGE_COLUMNS, TableWriter, message_row
+
+MESSAGES = [
+    {"user": "E1", "ts": "1700000000", "reply_count": 2, "reply_users_count": 1, "reply_users": ["E2"]},
+    # Counts that are not integers do not fit the integer columns
+    {"user": "E2", "ts": "1700000100", "reply_count": "3", "reply_users_count": 1.5},
+]
+
+
+def test_message_row_keeps_irregular_counts():
+    regular, irregular = (message_row("C1", "2024-01-01", msg) for msg in MESSAGES)
+    assert list(regular) == list(MESSAGE_COLUMNS)
+    assert (regular["reply_count"], regular["irregular"]) == (2, None)
+    assert (irregular["reply_count"], irregular["reply_users_count"]) == (None, None)
+    assert json.loads(irregular["irregular"]) == {"reply_count": "3", "reply_users_count": 1.5}
+
+
+def read_messages(archive, output_format):
+    with ZipFile(archive) as zipf:
+        data = zipf.read(f"messages.{output_format}")
+    if output_format == "ndjson":
+        return [json.loads(line) for line in data.splitlines()]
+    import pyarrow.parquet as pq
+
+    return pq.read_table(io.BytesIO(data)).to_pylist()
+
+
+@pytest.mark.parametrize("output_format", ["ndjson", "parquet"])
+def test_irregular_counts_survive_the_table(output_format):
+    if output_format == "parquet":
+        pytest.importorskip("pyarrow")
+
+    archive = io.BytesIO()
+    with ArchiveWriter(archive) as zipf, TableWriter(zipf, output_format) as tables:
+        tables.add_messages("C1", "2024-01-01", MESSAGES)
+        tables.close()
+    archive.seek(0)
+
+    rows = read_messages(archive, output_format)
+    assert rows == [message_row("C1", "2024-01-01", msg) for msg in MESSAGES]
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from timestamps import TimestampCoarsener, round_timestamp
+
+# (zone, UTC second of a DST change): spring forward and fall back, plus a 30 minute change
+DST_CHANGES = [
+    ("America/New_York", 1710054000),  # 2024-03-10 02:00 EST -> 03:00 EDT
+    ("America/New_York", 1730613600),  # 2024-11-03 02:00 EDT -> 01:00 EST
+    ("Australia/Lord_Howe", 1712415600),  # 2024-04-07 02:00 +11 -> 01:30 +10:30
+    ("UTC", 1710054000),
+]
+
+
+@pytest.fixture
+def local_zone(monkeypatch):
+    def set_zone(zone):
+        monkeypatch.setenv("TZ", zone)
+        time.tzset()
+
+    yield set_zone
+    monkeypatch.undo()
+    time.tzset()
+
+
+def values_around(change):
+    """Whole, fractional and rounding-edge timestamps from two hours before to two hours after change."""
+    values = []
+    for second in range(change - 7200, change + 7200, 37):
+        values += [str(second), f"{second}.000100", f"{second + 59}.9999996", float(second) + 0.5]
+    return values + [str(change), str(change - 1), f"{change - 1}.9999999"]
+
+
+@pytest.mark.parametrize("zone, change", DST_CHANGES)
+def test_coarsener_matches_round_timestamp_around_dst(local_zone, zone, change):
+    local_zone(zone)
+    values = values_around(change)
+    expected = [round_timestamp(value) for value in values]
+
+    assert [TimestampCoarsener()(value) for value in values] == expected
+    assert TimestampCoarsener().coarsen_many(values) == expected
+
+
+def test_repeated_local_hour_keeps_both_instants(local_zone):
+    local_zone("America/New_York")
+    coarsener = TimestampCoarsener()
+    # 01:30:20 local time occurs twice on 2024-11-03
+    first, second = 1730611820, 1730615420
+    assert coarsener(str(first)) == round_timestamp(str(first)) == str(first - 20)
+    assert coarsener(str(second)) == round_timestamp(str(second)) == str(second - 20)
+
+
+def test_unparsable_values_pass_through(local_zone):
+    local_zone("America/New_York")
+    values = ["", "not a timestamp", None, "-5", "1e400", "nan", 2 ** 40]
+    expected = [round_timestamp(value) for value in values]
+    assert [TimestampCoarsener()(value) for value in values] == expected
+    assert TimestampCoarsener().coarsen_many(values) == expected
+
+
+def thread_day(parent_ts, replies):
+    """Timestamps of one day file in the order anonymize_messages collects them."""
+    values = [parent_ts, parent_ts, f"{float(parent_ts) + replies * 60:.6f}"]  # ts, thread_ts, latest_reply
+    values += [f"{float(parent_ts) + i * 60:.6f}" for i in range(1, replies + 1)]  # replies
+    for i in range(1, replies + 1):
+        values += [f"{float(parent_ts) + i * 60:.6f}", parent_ts]  # reply message ts, thread_ts
+    return values
+
+
+def test_coarsen_many_memo_hit_rate(local_zone):
+    local_zone("UTC")
+    coarsener = TimestampCoarsener()
+    first = thread_day("1700000000.000100", 10)
+    assert coarsener.coarsen_many(first) == [round_timestamp(value) for value in first]
+    # Every value but the 11 distinct ones (latest_reply is the last reply) is a repeat within the day file
+    assert (coarsener.memo_hits, coarsener.memo_misses) == (len(first) - 11, 11)
+
+    # The next day file continues the thread: its repeated strings come from the memo
+    second = ["1700090000.000200", "1700000000.000100", "1700000600.000100"]
+    assert coarsener.coarsen_many(second) == [round_timestamp(value) for value in second]
+    assert (coarsener.memo_hits, coarsener.memo_misses) == (len(first) - 11 + 2, 12)
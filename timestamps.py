@@ -0,0 +1,161 @@
+import math
+from datetime import datetime
+
+import numpy as np
+
+# Entries kept in each memo before it is reset
+HOUR_CACHE_SIZE = 65536
+VALUE_CACHE_SIZE = 4096
+
+# Largest timestamp handled on the integer path (year ~2514); anything else uses round_timestamp
+_MAX_FAST_TIMESTAMP = 2 ** 34
+
+
+def round_timestamp(ts_string, round_to_minutes=1):
+    try:
+        ts_float = float(ts_string)
+        dt = datetime.fromtimestamp(ts_float)
+        # Round to nearest minute (remove seconds and microseconds)
+        rounded_dt = dt.replace(second=0, microsecond=0)
+        # Return as integer timestamp (no milliseconds)
+        return str(int(rounded_dt.timestamp()))
+    except:
+        return ts_string
+
+
+class TimestampCoarsener:
+    """
+    Coarsen Slack timestamps to the minute with exactly the results of
+    round_timestamp, working on integers.
+
+    In a UTC hour where the local offset is a whole number of minutes, does
+    not change, and local times are not ambiguous, round_timestamp truncates
+    to the UTC minute. That is checked once per hour and memoized. Hours
+    around DST changes and unparsable values fall through to round_timestamp.
+    Recent strings are memoized too; memo_hits and memo_misses count lookups.
+    """
+
+    def __init__(self):
+        self._hours = {}   # UTC hour -> True when round_timestamp truncates to the UTC minute
+        self._values = {}  # recent raw strings -> result, mostly repeated thread_ts
+        self.memo_hits = 0
+        self.memo_misses = 0
+
+    def __call__(self, value):
+        is_str = type(value) is str
+        if is_str:
+            cached = self._values.get(value)
+            if cached is not None:
+                self.memo_hits += 1
+                return cached
+        self.memo_misses += 1
+
+        try:
+            ts_float = float(value)
+            if not 0 <= ts_float < _MAX_FAST_TIMESTAMP:
+                return round_timestamp(value)
+            # Whole seconds as datetime.fromtimestamp sees them (microseconds rounded half-even)
+            frac, whole = math.modf(ts_float)
+            second = int(whole) + (round(frac * 1e6) >= 1000000)
+        except (TypeError, ValueError, OverflowError):
+            return round_timestamp(value)
+
+        if not self._regular_hour(second // 3600):
+            return round_timestamp(value)
+
+        result = str(second - second % 60)
+        if is_str:
+            if len(self._values) >= VALUE_CACHE_SIZE:
+                self._values.clear()
+            self._values[value] = result
+        return result
+
+    def coarsen_many(self, values):
+        """
+        Coarsen a batch of timestamps, e.g. every timestamp of one day file.
+        Strings seen recently (mostly a thread's thread_ts, repeated on every
+        reply) come from the memo; the others are parsed in one numpy call.
+        """
+        if not values:
+            return []
+
+        memo = self._values
+        results = [None] * len(values)
+        missed = []       # positions of the values to parse, each string once
+        missed_index = {}  # string -> index into missed
+        repeats = []      # (position, index into missed) of strings repeated within values
+        for i, value in enumerate(values):
+            if type(value) is str:
+                cached = memo.get(value)
+                if cached is not None:
+                    results[i] = cached
+                    continue
+                j = missed_index.get(value)
+                if j is not None:
+                    repeats.append((i, j))
+                    continue
+                missed_index[value] = len(missed)
+            missed.append(i)
+        self.memo_hits += len(values) - len(missed)
+        self.memo_misses += len(missed)
+        if not missed:
+            return results
+
+        pending = [values[i] for i in missed]
+        try:
+            # Converts each item with float(), except None, which becomes NaN and falls through below
+            parsed = np.array(pending, dtype=np.float64)
+        except (TypeError, ValueError, OverflowError):
+            parsed = np.empty(len(pending), dtype=np.float64)
+            for j, value in enumerate(pending):
+                try:
+                    parsed[j] = float(value)
+                except (TypeError, ValueError, OverflowError):
+                    parsed[j] = np.nan
+
+        fast = np.isfinite(parsed) & (parsed >= 0) & (parsed < _MAX_FAST_TIMESTAMP)
+        whole = np.floor(parsed, out=np.zeros_like(parsed), where=fast)
+        micros = np.rint((parsed - whole) * 1e6, out=np.zeros_like(parsed), where=fast)
+        seconds = (whole + (micros >= 1000000)).astype(np.int64)
+
+        hours, inverse = np.unique(seconds[fast] // 3600, return_inverse=True)
+        regular_hours = np.array([self._regular_hour(hour) for hour in hours.tolist()], dtype=bool)
+        fast[fast] = regular_hours[inverse.reshape(-1)]
+
+        coarsened = (seconds - seconds % 60).astype(str).tolist()
+        for j, (i, value, is_fast) in enumerate(zip(missed, pending, fast.tolist())):
+            if not is_fast:
+                results[i] = round_timestamp(value)
+                continue
+            results[i] = coarsened[j]
+            if type(value) is str:
+                if len(memo) >= VALUE_CACHE_SIZE:
+                    memo.clear()
+                memo[value] = coarsened[j]
+        for i, j in repeats:
+            results[i] = results[missed[j]]
+        return results
+
+    def _regular_hour(self, hour):
+        regular = self._hours.get(hour)
+        if regular is None:
+            if len(self._hours) >= HOUR_CACHE_SIZE:
+                self._hours.clear()
+            regular = self._hours[hour] = _is_regular_hour(hour)
+        return regular
+
+
+def _is_regular_hour(hour):
+    start = hour * 3600
+    last_minute = start + 3540
+    try:
+        first, last = datetime.fromtimestamp(start), datetime.fromtimestamp(start + 3599)
+    except (OverflowError, OSError, ValueError):
+        return False
+
+    # Whole-minute offset that stays the same for the whole hour
+    if first.second != 0 or (last - first).total_seconds() != 3599:
+        return False
+
+    # Local times map back to the same instant (not the repeated hour of a DST change)
+    return round_timestamp(start) == str(start) and round_timestamp(last_minute) == str(last_minute)